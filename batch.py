@@ -0,0 +1,303 @@
+"""
+batch.py
+多进程批量处理
+光效层放在共享内存中, 各工作进程只映射一次; 工作进程定时汇报进度, 由主进程汇总
+RenderJob 可以取消、暂停与继续一次批处理, 配合检查点 (checkpoint.py) 在中断后从中断处继续
+"""
+import multiprocessing
+import os
+import signal
+from concurrent.futures import ProcessPoolExecutor, Future, FIRST_EXCEPTION, wait
+from dataclasses import dataclass
+from multiprocessing import shared_memory
+from multiprocessing.queues import Queue
+from os.path import basename
+from queue import Empty
+from itertools import islice
+from time import perf_counter
+from typing import Callable, Iterable, Iterator, TypeVar
+
+import numpy as np
+
+import profiling
+from checkpoint import Checkpoint, missing_ranges
+from compositor import process_an_file, process_files, group_by_size, loop_period
+from glint import load_cached_glint
+from render_cache import RenderCache
+from output import (OutputWays, EncoderSettings, output_frames, output_stacked_frames, write_frames, FramesDirWriter,
+                    new_frames_dir, buffered, is_frames_output, frames_for_output)
+
+PROGRESS_INTERVAL = 0.1  # 工作进程汇报进度的最小间隔 (秒)
+MIN_FRAMES_PER_TASK = 64  # 拆分单个文件时每个任务至少包含的帧数
+MAX_STACK_ITEMS = 16  # 尺寸相同的文件合并为一个任务一起叠加时, 每个任务最多包含的文件数
+
+T = TypeVar("T")
+
+
+class JobCancelled(Exception):
+    """批处理被 RenderJob.cancel 取消"""
+
+
+class RenderJob:
+    """
+    控制一次批处理, 可在任意线程中调用 cancel / pause / resume
+    状态是进程间共享的事件, 工作进程每生成一帧检查一次: 暂停时停在当前帧, 取消时放弃正在写的输出
+    """
+
+    def __init__(self):
+        self.cancelled = multiprocessing.Event()
+        self.running = multiprocessing.Event()
+        self.running.set()
+
+    def cancel(self):
+        self.cancelled.set()
+        self.running.set()
+
+    def pause(self):
+        self.running.clear()
+
+    def resume(self):
+        self.running.set()
+
+    @property
+    def paused(self) -> bool:
+        return not self.running.is_set()
+
+    def check(self):
+        """暂停时等待继续或取消, 已取消时抛出 JobCancelled"""
+        self.running.wait()
+        if self.cancelled.is_set():
+            raise JobCancelled()
+
+    def controlled(self, items: Iterable[T]) -> Iterator[T]:
+        """在生成每一项之前检查状态"""
+        self.check()
+        for item in items:
+            yield item
+            self.check()
+
+
+@dataclass
+class RenderTask:
+    filenames: list[str]  # 多个文件时尺寸相同, 堆叠后一起叠加
+    start: int
+    stop: int
+    frames_dir: str | None = None  # 逐帧输出的任务写入的已有文件夹
+
+
+# 工作进程中的全局状态, 由 init_worker 设置
+worker_glint: np.ndarray | None = None
+worker_shm: shared_memory.SharedMemory | None = None
+worker_progress: Queue | None = None
+worker_job: RenderJob | None = None
+
+
+def init_worker(shm_name: str, shape: tuple[int, ...], progress: Queue, job: RenderJob, profile: bool = False):
+    global worker_glint, worker_shm, worker_progress, worker_job
+    # Ctrl+C 只由主进程处理, 再通过 job 取消各工作进程中的任务
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if profile:
+        profiling.enable()
+    worker_shm = shared_memory.SharedMemory(name=shm_name)
+    worker_glint = np.ndarray(shape, np.uint8, worker_shm.buf)
+    worker_progress = progress
+    worker_job = job
+
+
+def render_task(task_id: int, task: RenderTask, output_dir: str, output_way: OutputWays, frame_count: int,
+                input_scale: int, settings: EncoderSettings | None) -> tuple[list[list[str]], dict | None]:
+    """
+    处理一个任务, 返回 (各文件写出的文件或文件夹, 开启性能统计时本任务的统计)
+    被取消时抛出 JobCancelled, 之前汇报最后的进度 (逐帧输出时即已保存的帧数, 供检查点记录)
+    """
+    last_report = perf_counter()
+    last_value = 0
+    period = loop_period((worker_glint.shape[1], worker_glint.shape[0]))
+    rendered = frames_for_output(output_way, frame_count, period)
+
+    def report(value: int):
+        nonlocal last_report, last_value
+        last_value = value
+        if perf_counter() - last_report > PROGRESS_INTERVAL:
+            last_report = perf_counter()
+            worker_progress.put((task_id, value))
+
+    try:
+        if len(task.filenames) > 1:
+            frame_lists = buffered(worker_job.controlled(
+                process_files(task.filenames, worker_glint, rendered, input_scale)))
+            outputs = output_stacked_frames(list(map(basename, task.filenames)), output_dir, frame_lists, output_way,
+                                            report, settings, period, frame_count)
+        else:
+            filename = task.filenames[0]
+            frames = buffered(worker_job.controlled(
+                process_an_file(filename, worker_glint, rendered, input_scale, start=task.start, stop=task.stop)))
+            if task.frames_dir is None:
+                outputs = [output_frames(basename(filename), output_dir, frames, output_way, report, settings, period,
+                                         frame_count)]
+            else:
+                write_frames(FramesDirWriter(filename, task.frames_dir, output_way, task.start, settings), frames,
+                             report)
+                outputs = [[task.frames_dir]]
+    except JobCancelled:
+        worker_progress.put((task_id, last_value))
+        raise
+    worker_progress.put((task_id, (task.stop - task.start) * len(task.filenames)))
+    return outputs, profiling.take() if profiling.enabled else None
+
+
+def split_tasks(filenames: list[str], output_dir: str, output_way: OutputWays, frame_count: int, input_scale: int,
+                workers: int, checkpoint: Checkpoint | None = None) -> list[RenderTask]:
+    """
+    逐帧输出时每个文件单独成为任务, 以便检查点按文件记录已保存的帧; 文件数少于进程数时再按帧范围拆成多个任务,
+    检查点中已保存部分帧的文件只补齐缺少的帧 (帧都已保存时为一个空任务);
+    其他输出方式 (包括同时输出多种格式) 文件多于进程数时, 把尺寸相同的文件合并为一个任务 (每个进程至少分到一个任务),
+    否则每个文件一个任务
+    """
+    if not is_frames_output(output_way):
+        max_group = max(1, min(MAX_STACK_ITEMS, len(filenames) // workers))
+        return [RenderTask(group, 0, frame_count) for group in group_by_size(filenames, input_scale, max_group)]
+    parts = 1
+    if 0 < len(filenames) < workers:
+        parts = max(1, min(-(-workers // len(filenames)), frame_count // MIN_FRAMES_PER_TASK))
+    tasks = []
+    for filename in filenames:
+        saved = checkpoint.saved_frames(filename) if checkpoint is not None else None
+        if saved is None:
+            frames_dir = new_frames_dir(basename(filename), output_dir)
+            if checkpoint is not None:
+                checkpoint.start_frames(filename, frames_dir)
+            ranges = [(0, frame_count)]
+        else:
+            frames_dir, done = saved
+            ranges = missing_ranges(done, frame_count) or [(frame_count, frame_count)]
+        for start, stop in ranges:
+            range_parts = max(1, round(parts * (stop - start) / frame_count))
+            bounds = [start + (stop - start) * i // range_parts for i in range(range_parts + 1)]
+            tasks.extend(RenderTask([filename], a, b, frames_dir) for a, b in zip(bounds, bounds[1:]))
+    return tasks
+
+
+def render_batch(filenames: Iterable[str], output_dir: str, output_way: OutputWays, frame_count: int,
+                 glint_scale: int, input_scale: int, cbk: Callable[[str, int, int, int, int], None],
+                 workers: int | None = None, settings: EncoderSettings | None = None,
+                 cache: RenderCache | None = None, job: RenderJob | None = None,
+                 checkpoint: Checkpoint | None = None):
+    """
+    用进程池处理一批文件
+    filenames 可以是惰性的迭代器 (如 ingest.iter_inputs), 每次取出一部分拆分为任务, 枚举未结束时已开始处理
+    cbk 参数: (当前文件名, 已完成文件数, 已枚举的总文件数, 已写入帧数, 总帧数)
+    给出 cache 时跳过输出已是最新的文件 (计入已完成), 并在结束或出错时把新渲染的文件写入清单
+    给出 job 时可以从其他线程取消 (抛出 JobCancelled)、暂停与继续; 主线程中的 KeyboardInterrupt 同样会取消各任务
+    给出 checkpoint 时跳过其中已完成的文件, 逐帧输出只补齐缺少的帧; 全部完成后删除检查点, 中断时保留
+    """
+    workers = workers or os.cpu_count() or 1
+    job = job or RenderJob()
+    filenames = iter(filenames)
+    glint = load_cached_glint(glint_scale)[1]
+    # 同时输出资源包时至少生成一个周期, 进度按实际生成的帧数计算
+    rendered = frames_for_output(output_way, frame_count, loop_period((glint.shape[1], glint.shape[0])))
+    shm = shared_memory.SharedMemory(create=True, size=glint.nbytes)
+    progress: Queue = multiprocessing.Queue()
+    tasks: list[RenderTask] = []
+    task_progress: list[int] = []
+    files_left: dict[str, int] = {}
+    total_files = 0
+    skipped_frames = 0  # 无需渲染的帧: 缓存命中或检查点中已完成的文件, 以及已保存的帧
+    files_done = 0
+    current = ""
+
+    def collect_progress():
+        while True:
+            try:
+                task_id, value = progress.get_nowait()
+            except Empty:
+                return
+            task_progress[task_id] = value
+            task = tasks[task_id]
+            if checkpoint is not None and task.frames_dir is not None:
+                checkpoint.frames_saved(task.filenames[0], task.start, task.start + value)
+
+    def report():
+        collect_progress()
+        if total_files:
+            with profiling.stage("progress_callback"):
+                cbk(current, files_done, total_files, skipped_frames + sum(task_progress), total_files * rendered)
+
+    try:
+        np.ndarray(glint.shape, np.uint8, shm.buf)[:] = glint
+        with ProcessPoolExecutor(workers, initializer=init_worker,
+                                 initargs=(shm.name, glint.shape, progress, job, profiling.enabled)) as executor:
+            try:
+                futures: dict[Future, int] = {}
+                pending: set[Future] = set()
+                exhausted = False
+                while not exhausted or pending:
+                    if job.cancelled.is_set():
+                        raise JobCancelled()
+                    # 等待中的任务不足时, 从输入中再取一部分; 暂停时不再取
+                    if not exhausted and len(pending) < workers * 2 and not job.paused:
+                        chunk = list(islice(filenames, workers * MAX_STACK_ITEMS))
+                        exhausted = not chunk
+                        total_files += len(chunk)
+                        todo = chunk
+                        if checkpoint is not None:
+                            todo = [filename for filename in todo if not checkpoint.completed(filename)]
+                        if cache is not None:
+                            todo = [filename for filename in todo if not cache.lookup(filename)]
+                        files_done += len(chunk) - len(todo)
+                        chunk_tasks = split_tasks(todo, output_dir, output_way, rendered, input_scale, workers,
+                                                  checkpoint)
+                        skipped_frames += len(chunk) * rendered - sum(
+                            (task.stop - task.start) * len(task.filenames) for task in chunk_tasks)
+                        for task in chunk_tasks:
+                            for filename in task.filenames:
+                                files_left[filename] = files_left.get(filename, 0) + 1
+                            future = executor.submit(render_task, len(tasks), task, output_dir, output_way,
+                                                     frame_count, input_scale, settings)
+                            futures[future] = len(tasks)
+                            pending.add(future)
+                            tasks.append(task)
+                            task_progress.append(0)
+                        if not current and chunk:
+                            current = basename(chunk[0])
+                        if not exhausted and len(pending) < workers * 2:
+                            report()
+                            continue
+                    if not pending:  # 暂停且没有正在运行的任务
+                        job.running.wait(PROGRESS_INTERVAL)
+                        continue
+                    done, pending = wait(pending, PROGRESS_INTERVAL, FIRST_EXCEPTION)
+                    for future in done:
+                        if future.exception() is not None:
+                            raise future.exception()
+                        task_outputs, stats = future.result()
+                        if stats is not None:
+                            profiling.merge(stats)
+                        for filename, outputs in zip(tasks[futures[future]].filenames, task_outputs):
+                            files_left[filename] -= 1
+                            if files_left[filename] == 0:
+                                files_done += 1
+                                current = basename(filename)
+                                if cache is not None:
+                                    cache.record(filename, outputs)
+                                if checkpoint is not None:
+                                    checkpoint.mark_done(filename)
+                    report()
+            except BaseException:
+                # 取消其余任务, 正在运行的任务在下一帧放弃 (已保存的帧保留), 退出 with 时等待它们结束
+                job.cancel()
+                executor.shutdown(cancel_futures=True)
+                raise
+        report()
+        if checkpoint is not None:
+            checkpoint.finish()
+    finally:
+        # 工作进程被取消前汇报的最后进度也要记入检查点
+        collect_progress()
+        if checkpoint is not None:
+            checkpoint.close()
+        shm.close()
+        shm.unlink()
+        if cache is not None:
+            cache.save()
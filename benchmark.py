@@ -0,0 +1,369 @@
+"""
+benchmark.py
+性能测试: 对比旧实现与当前实现, 以及可重复的基准测试套件与逐帧哈希校验
+用法: python benchmark.py [--suite] [--quick] [-o 结果.json] [--compare 基准结果.json] [--update-golden]
+不带参数时运行新旧实现的对比; --suite 运行基准测试套件并把结果写入文件, 两者都会先做逐帧哈希校验
+"""
+import argparse
+import hashlib
+import json
+import os
+import platform
+import sys
+import tempfile
+from io import BytesIO
+from time import perf_counter
+from typing import Callable
+
+import numpy as np
+import PIL
+from PIL import Image, ImageFilter, ImageEnhance
+
+from compositor import GlintCompositor, StackCompositor, process_an_file, loop_period
+from glint import GLINT_PATH, build_glint, load_cached_glint
+from output import OutputWay, end_fix_trans_map, output_frames, output_size
+
+GOLDEN_PATH = "benchmark_golden.json"
+SUITE_SIZES = (16, 32, 64, 128, 256, 512)
+ALPHA_MODES = ("mixed", "opaque", "binary", "soft")
+results: list[dict] = []  # 基准测试套件的结果, 每项为 {"bench", "case", 指标...}
+
+
+def legacy_load_glint(scale: int):
+    """旧版逐像素 getpixel/putpixel 实现, 作为对照"""
+
+    def convert_as_alpha(point: tuple[int, int, int, int]):
+        return point[0], point[1], point[2], 255 - int(
+            ((112 - point[0]) / 138 + (68 - point[1]) / 76 + (159 - point[2]) / 207) * 85)
+
+    glint_cover = Image.open(GLINT_PATH).convert("RGBA")
+    # noinspection PyTypeChecker
+    [[glint_cover.putpixel((x, y), convert_as_alpha(glint_cover.getpixel((x, y)))) for x in range(glint_cover.width)]
+     for y in range(glint_cover.height)]
+    glint_cover = glint_cover.resize(tuple(map(lambda x: x * scale, glint_cover.size)))
+    glint_cover = glint_cover.filter(ImageFilter.GaussianBlur(3))
+    glint_cover = ImageEnhance.Brightness(glint_cover).enhance(1.2)
+    glint_cover = Image.merge("RGBA", [*glint_cover.split()[:3], glint_cover.getchannel("A").point(lambda x: x // 2)])
+    return glint_cover
+
+
+def legacy_crop_and_paste(raw_image: Image.Image, glint: Image.Image, crop_start_x: int, crop_start_y: int,
+                          crop_stop_x: int, crop_stop_y: int, paste_x: int, paste_y: int):
+    cropped_glint: Image.Image = glint.crop((crop_start_x, crop_start_y, crop_stop_x, crop_stop_y)).convert("RGBA")
+    mask: Image.Image = Image.new("L", cropped_glint.size)
+    mask.paste(cropped_glint.getchannel("A"), (0, 0), raw_image.crop(
+        (paste_x, paste_y, paste_x + cropped_glint.width, paste_y + cropped_glint.height)).getchannel("A"))
+    raw_image.paste(cropped_glint, (paste_x, paste_y), mask)
+
+
+def legacy_process_frames(raw_image: Image.Image, glint: Image.Image, frame_count: int):
+    """旧版逐帧 crop_and_paste 的叠加循环 (不含读取与缩放), 作为对照"""
+    frames = []
+    x_offset = 0
+    y_offset = 0
+    width, height = glint.size
+    for i in range(0, frame_count):
+        enchanted = raw_image.copy()
+        crop_start_x, crop_start_y = x_offset % width, y_offset % height
+        crop_stop_x, crop_stop_y = crop_start_x + enchanted.width, crop_start_y + enchanted.height
+        legacy_crop_and_paste(enchanted, glint, crop_start_x, crop_start_y, min(crop_stop_x, width),
+                              min(crop_stop_y, height), 0, 0)
+        if crop_start_x + enchanted.width > width and crop_start_y + enchanted.height > height:
+            legacy_crop_and_paste(enchanted, glint, 0, 0, crop_stop_x - width, crop_stop_y - height,
+                                  enchanted.width - (crop_stop_x - width), enchanted.height - (crop_stop_y - height))
+        if crop_start_x + enchanted.width > width:
+            legacy_crop_and_paste(enchanted, glint, 0, crop_start_y, crop_stop_x - width, min(crop_stop_y, height),
+                                  enchanted.width - (crop_stop_x - width), 0)
+        if crop_start_y + enchanted.height > height:
+            legacy_crop_and_paste(enchanted, glint, crop_start_x, 0, min(crop_stop_x, width), crop_stop_y - height,
+                                  0, enchanted.height - (crop_stop_y - height))
+        frames.append(enchanted)
+        x_offset += -2
+        y_offset += 2
+    return frames
+
+
+def synthetic_input(size: int, scale: int = 1, seed: int = 0, alpha: str = "mixed") -> Image.Image:
+    """
+    生成随机输入图, 并按 BOX 缩放; 结果只由参数决定
+    alpha: mixed 透明/半透明/不透明混合, opaque 全不透明, binary 只有全透明与不透明, soft 平滑渐变的半透明
+    """
+    rng = np.random.default_rng(seed)
+    pixels = rng.integers(0, 256, (size, size, 4), np.uint8)
+    if alpha == "mixed":
+        pixels[..., 3][rng.random((size, size)) < 0.3] = 0
+        pixels[..., 3][rng.random((size, size)) < 0.4] = 255
+    elif alpha == "opaque":
+        pixels[..., 3] = 255
+    elif alpha == "binary":
+        pixels[..., 3] = np.where(rng.random((size, size)) < 0.5, 0, 255)
+    elif alpha == "soft":
+        ramp = np.linspace(0, 255, size, dtype=np.float64)
+        pixels[..., 3] = ((ramp[:, None] + ramp[None, :]) / 2).astype(np.uint8)
+    else:
+        raise ValueError(f"Invalid alpha mode: {alpha}")
+    image = Image.fromarray(pixels)
+    return image.resize((size * scale, size * scale), resample=Image.Resampling.BOX)
+
+
+def timeit(func: Callable[[], object], repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = perf_counter()
+        func()
+        best = min(best, perf_counter() - start)
+    return best
+
+
+def bench_glint():
+    print("== 光效层生成 ==")
+    print(f"{'缩放':>4} {'旧实现(ms)':>12} {'新实现(ms)':>12} {'缓存(ms)':>10} {'加速比':>8} 一致")
+    for scale in range(2, 9):
+        legacy = timeit(lambda: legacy_load_glint(scale))
+        current = timeit(lambda: build_glint(scale))
+        load_cached_glint(scale)
+        cached = timeit(lambda: load_cached_glint(scale))
+        same = np.array_equal(np.asarray(legacy_load_glint(scale)), build_glint(scale)[1])
+        print(f"{scale:>4} {legacy * 1000:>12.2f} {current * 1000:>12.2f} {cached * 1000:>10.2f} "
+              f"{legacy / current:>8.2f} {same}")
+
+
+def bench_compose(frame_count: int = 1650):
+    print(f"== 逐帧叠加 ({frame_count} 帧) ==")
+    print(f"{'输入':>9} {'旧实现(帧/s)':>14} {'新实现(帧/s)':>14} {'加速比':>8} 一致")
+    glint_cover, glint_array = build_glint(4)
+    for size, scale in [(16, 1), (16, 10), (16, 20), (64, 10)]:
+        raw_image = synthetic_input(size, scale)
+        legacy = timeit(lambda: legacy_process_frames(raw_image, glint_cover, frame_count), 1)
+        compositor = GlintCompositor(raw_image, glint_array)
+        current = timeit(lambda: [compositor.compose_frame(i) for i in range(frame_count)], 1)
+        same = all(np.array_equal(np.asarray(frame), np.asarray(compositor.compose_frame(i)))
+                   for i, frame in enumerate(legacy_process_frames(raw_image, glint_cover, 64)))
+        print(f"{raw_image.width:>4}x{raw_image.height:<4} {frame_count / legacy:>14.1f} "
+              f"{frame_count / current:>14.1f} {legacy / current:>8.2f} {same}")
+
+
+def bench_stack(item_count: int = 64, frame_count: int = 256):
+    print(f"== 同尺寸堆叠叠加 ({item_count} 张 x {frame_count} 帧) ==")
+    print(f"{'输入':>9} {'逐张(张·帧/s)':>15} {'堆叠(张·帧/s)':>15} {'加速比':>8} 一致")
+    glint_array = build_glint(4)[1]
+    for size, scale in [(16, 1), (16, 4), (16, 10)]:
+        raw_images = [synthetic_input(size, scale, seed) for seed in range(item_count)]
+        compositors = [GlintCompositor(raw_image, glint_array) for raw_image in raw_images]
+        single = timeit(lambda: [compositor.compose_frame(i) for i in range(frame_count) for compositor in compositors],
+                        1)
+        stack = StackCompositor(raw_images, glint_array)
+        stacked = timeit(lambda: [stack.compose_frame(i) for i in range(frame_count)], 1)
+        same = all(np.array_equal(np.asarray(frame), np.asarray(compositor.compose_frame(i)))
+                   for i in range(0, frame_count, 17) for frame, compositor in zip(stack.compose_frame(i), compositors))
+        items = item_count * frame_count
+        print(f"{size * scale:>4}x{size * scale:<4} {items / single:>15.1f} {items / stacked:>15.1f} "
+              f"{single / stacked:>8.2f} {same}")
+
+
+def legacy_save_animation(frames: list[Image.Image], end_fix: str) -> int:
+    """旧版 save_all 一次性编码 (第一帧会写入两次), 返回文件大小"""
+    buf = BytesIO()
+    frames[0].save(buf, end_fix.upper(), save_all=True, append_images=frames, duration=1000 / 20, loop=0)
+    return len(buf.getvalue())
+
+
+def bench_encode(frame_count: int = 256):
+    print(f"== 动图编码 ({frame_count} 帧) ==")
+    print(f"{'格式':>5} {'旧耗时(s)':>10} {'旧大小(KB)':>11} {'新耗时(s)':>10} {'新大小(KB)':>11}")
+    with tempfile.TemporaryDirectory() as temp_dir:
+        raw = np.array(synthetic_input(16))
+        raw[:3] = 0
+        raw[:, :2] = 0
+        input_path = os.path.join(temp_dir, "input.png")
+        Image.fromarray(raw).save(input_path)
+        frames = list(process_an_file(input_path, build_glint(4)[0], frame_count, 10))
+        output_dir = os.path.join(temp_dir, "output")
+        os.mkdir(output_dir)
+        for output_way in [OutputWay.ONEFILE_GIF, OutputWay.ONEFILE_APNG, OutputWay.ONEFILE_WEBP]:
+            end_fix = end_fix_trans_map[output_way]
+            start = perf_counter()
+            legacy_size = legacy_save_animation(frames, end_fix)
+            legacy = perf_counter() - start
+            start = perf_counter()
+            output_frames("input.png", output_dir, frames, output_way, lambda x: None)
+            current = perf_counter() - start
+            size = os.path.getsize(os.path.join(output_dir, f"input.{end_fix}"))
+            print(f"{end_fix:>5} {legacy:>10.2f} {legacy_size / 1024:>11.1f} {current:>10.2f} {size / 1024:>11.1f}")
+
+
+def record(bench: str, case: str, **metrics):
+    results.append({"bench": bench, "case": case, **metrics})
+
+
+def save_input(image: Image.Image, temp_dir: str, name: str) -> str:
+    path = os.path.join(temp_dir, name)
+    image.save(path)
+    return path
+
+
+def golden_cases() -> list[tuple[str, int, str, int, int, int]]:
+    """(名称, 尺寸, 透明度, 输入缩放, 光效缩放, 总帧数); 总帧数覆盖不足一个周期、恰好一个周期与超过一个周期"""
+    return [(f"{size}px_{alpha}_x{scale}_g{glint_scale}_{frame_count}f", size, alpha, scale, glint_scale, frame_count)
+            for size, alpha, scale, glint_scale, frame_count in [
+                (16, "mixed", 1, 4, 300), (16, "binary", 10, 4, 64), (16, "soft", 4, 2, 80),
+                (32, "opaque", 4, 8, 40), (64, "mixed", 10, 4, 12), (512, "mixed", 1, 2, 8),
+                (300, "soft", 2, 3, 6)]]
+
+
+def frame_hashes(path: str, scale: int, glint_scale: int, frame_count: int) -> list[str]:
+    """process_an_file 输出的每一帧 RGBA 数据的 sha1"""
+    return [hashlib.sha1(frame.tobytes()).hexdigest()
+            for frame in process_an_file(path, load_cached_glint(glint_scale)[0], frame_count, scale)]
+
+
+def check_golden(update: bool = False) -> bool:
+    """
+    与 GOLDEN_PATH 中记录的逐帧哈希比较, 保证更快的实现与当前 process_an_file 的输出逐位一致
+    update 为真时重新生成记录 (只应在确认输出本应改变时使用); 光效层由 Pillow 模糊生成, 记录中附带 Pillow 版本
+    """
+    print("== 逐帧哈希校验 ==")
+    golden = {}
+    if not update and os.path.isfile(GOLDEN_PATH):
+        with open(GOLDEN_PATH, encoding="utf-8") as f:
+            golden = json.load(f)
+        if golden.get("pillow") != PIL.__version__:
+            print(f"注意: 记录由 Pillow {golden.get('pillow')} 生成, 当前为 {PIL.__version__}")
+    ok = True
+    cases = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for name, size, alpha, scale, glint_scale, frame_count in golden_cases():
+            path = save_input(synthetic_input(size, 1, size, alpha), temp_dir, f"{name}.png")
+            cases[name] = frame_hashes(path, scale, glint_scale, frame_count)
+            if update:
+                # 新记录必须与旧版实现逐帧一致
+                raw_image = Image.open(path).convert("RGBA")
+                raw_image = raw_image.resize((raw_image.width * scale, raw_image.height * scale),
+                                             resample=Image.Resampling.BOX)
+                legacy = [hashlib.sha1(frame.tobytes()).hexdigest() for frame in
+                          legacy_process_frames(raw_image, legacy_load_glint(glint_scale), min(frame_count, 64))]
+                if legacy != cases[name][:len(legacy)]:
+                    print(f"{name}: 与旧版实现不一致, 不更新记录")
+                    return False
+                continue
+            expected = golden.get("cases", {}).get(name)
+            if expected is None:
+                print(f"{name}: 没有记录")
+                ok = False
+            elif expected != cases[name]:
+                mismatched = [i for i, (a, b) in enumerate(zip(expected, cases[name])) if a != b]
+                print(f"{name}: 不一致, 帧 {mismatched[:10]}{' ...' if len(mismatched) > 10 else ''}"
+                      f" (帧数 {len(cases[name])}/{len(expected)})")
+                ok = False
+            else:
+                print(f"{name}: 一致 ({len(expected)} 帧)")
+    if update:
+        with open(GOLDEN_PATH, "w", encoding="utf-8") as f:
+            json.dump({"pillow": PIL.__version__, "numpy": np.__version__, "cases": cases}, f, indent=1)
+        print(f"已更新 {GOLDEN_PATH}, 共 {len(cases)} 组")
+    return ok
+
+
+def suite_glint():
+    print("== 光效层准备 ==")
+    for scale in range(2, 9):
+        built = timeit(lambda: build_glint(scale))
+        load_cached_glint(scale)
+        cached = timeit(lambda: load_cached_glint(scale))
+        record("glint", f"g{scale}", build_ms=built * 1000, cached_ms=cached * 1000)
+        print(f"g{scale}: 生成 {built * 1000:.2f}ms  缓存 {cached * 1000:.2f}ms")
+
+
+def suite_compose(sizes: tuple[int, ...], glint_scales: tuple[int, ...], frame_count: int):
+    print(f"== 逐帧叠加 (每组 {frame_count} 个不同的帧) ==")
+    for glint_scale in glint_scales:
+        glint_array = load_cached_glint(glint_scale)[1]
+        period = loop_period((glint_array.shape[1], glint_array.shape[0]))
+        for size in sizes:
+            for alpha in ALPHA_MODES:
+                compositor = GlintCompositor(synthetic_input(size, 1, size, alpha), glint_array)
+                frames = min(frame_count, period)
+                seconds = timeit(lambda: [compositor.compose_frame(i) for i in range(frames)], 1)
+                case = f"{size}px_{alpha}_g{glint_scale}"
+                record("compose", case, fps=frames / seconds, ms_per_frame=seconds / frames * 1000)
+                print(f"{case}: {frames / seconds:.1f} 帧/s")
+
+
+def suite_encode(size: int, scale: int, frame_counts: tuple[int, ...]):
+    print(f"== 各输出方式编码 ({size * scale}x{size * scale}) ==")
+    glint = load_cached_glint(4)[0]
+    with tempfile.TemporaryDirectory() as temp_dir:
+        path = save_input(synthetic_input(size, 1, size), temp_dir, "input.png")
+        for frame_count in frame_counts:
+            frames = list(process_an_file(path, glint, frame_count, scale))
+            for output_way in OutputWay:
+                output_dir = os.path.join(temp_dir, f"{output_way.name}_{frame_count}")
+                os.mkdir(output_dir)
+                start = perf_counter()
+                outputs = output_frames("input.png", output_dir, frames, output_way, lambda x: None)
+                seconds = perf_counter() - start
+                nbytes = sum(map(output_size, outputs))
+                case = f"{output_way.name}_{frame_count}f"
+                record("encode", case, fps=frame_count / seconds, seconds=seconds, bytes=nbytes)
+                print(f"{case}: {frame_count / seconds:.1f} 帧/s  {nbytes / 1024:.1f}KB")
+
+
+def environment() -> dict:
+    return {"python": sys.version.split()[0], "pillow": PIL.__version__, "numpy": np.__version__,
+            "platform": platform.platform(), "cpu_count": os.cpu_count()}
+
+
+def compare(baseline_path: str):
+    """按 (bench, case) 对比两次结果, 比值 > 1 表示本次更快 (耗时类指标取倒数)"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {(row["bench"], row["case"]): row for row in json.load(f)["results"]}
+    print(f"== 与 {baseline_path} 对比 ==")
+    for row in results:
+        old = baseline.get((row["bench"], row["case"]))
+        if old is None:
+            continue
+        ratios = []
+        for metric, value in row.items():
+            if metric in ["bench", "case", "bytes"] or metric not in old or not value or not old[metric]:
+                continue
+            ratio = value / old[metric] if metric == "fps" else old[metric] / value
+            ratios.append(f"{metric} {ratio:.2f}x")
+        print(f"{row['bench']}/{row['case']}: {'  '.join(ratios)}")
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description="性能测试与逐帧哈希校验")
+    parser.add_argument("--suite", action="store_true", help="运行基准测试套件 (默认运行新旧实现对比)")
+    parser.add_argument("--quick", action="store_true", help="套件只使用较少的尺寸与帧数")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="套件结果文件")
+    parser.add_argument("--compare", metavar="PATH", help="与之前的套件结果文件对比")
+    parser.add_argument("--update-golden", action="store_true", help="重新生成逐帧哈希记录")
+    args = parser.parse_args(argv)
+    if not check_golden(args.update_golden):
+        print("逐帧哈希校验失败", file=sys.stderr)
+        return 1
+    if args.update_golden:
+        return 0
+    if not args.suite:
+        bench_glint()
+        bench_compose()
+        bench_stack()
+        bench_encode()
+        return 0
+    if args.quick:
+        sizes, glint_scales, frame_count, frame_counts = (16, 64, 512), (4,), 32, (32,)
+    else:
+        sizes, glint_scales, frame_count, frame_counts = SUITE_SIZES, (2, 4, 8), 128, (64, 256)
+    suite_glint()
+    suite_compose(sizes, glint_scales, frame_count)
+    suite_encode(16, 4, frame_counts)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({"environment": environment(), "results": results}, f, ensure_ascii=False, indent=1)
+    print(f"结果已写入 {args.output}")
+    if args.compare:
+        compare(args.compare)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,140 @@
+"""
+checkpoint.py
+批处理的检查点日志
+输出文件夹中的日志逐行追加记录已完成的文件, 以及逐帧输出时各文件已保存的帧范围;
+中断 (取消、出错或进程被结束) 后用相同的参数再次处理时, 跳过已完成的文件, 逐帧输出的文件只补齐缺少的帧
+每组渲染参数使用单独的日志, 同时向一个输出文件夹处理的批处理互不覆盖; 全部处理完成后删除日志
+"""
+import hashlib
+import json
+import os
+from dataclasses import dataclass, field
+from os.path import abspath, isdir, join
+
+from ingest import input_signature
+from output import OutputWays, EncoderSettings
+from render_cache import render_params
+
+JOURNAL_NAME = ".glint_journal.{}.jsonl"  # {} 为渲染参数的哈希
+
+
+@dataclass
+class FileProgress:
+    signature: str
+    frames_dir: str | None = None  # 逐帧输出的文件夹, 相对于输出文件夹
+    ranges: dict[int, int] = field(default_factory=dict)  # 已保存的帧范围: 起始帧 -> 结束帧 (不含)
+    done: bool = False
+
+
+def missing_ranges(ranges: dict[int, int], frame_count: int) -> list[tuple[int, int]]:
+    """[0, frame_count) 中未被 ranges 覆盖的部分"""
+    missing = []
+    position = 0
+    for start, stop in sorted(ranges.items()):
+        if start > position:
+            missing.append((position, start))
+        position = max(position, stop)
+    if position < frame_count:
+        missing.append((position, frame_count))
+    return missing
+
+
+class Checkpoint:
+    """
+    一个输出文件夹与一组渲染参数对应的检查点
+    日志只追加不截断, 同时运行的相同参数的批处理共用一个日志; resume 为 False 时丢弃已有的记录重新开始
+    """
+
+    def __init__(self, output_dir: str, output_way: OutputWays, frame_count: int, glint_scale: int, input_scale: int,
+                 settings: EncoderSettings | None = None, resume: bool = True):
+        self.output_dir = output_dir
+        params = render_params(output_way, frame_count, glint_scale, input_scale, settings)
+        self.path = join(output_dir, JOURNAL_NAME.format(hashlib.sha1(params.encode()).hexdigest()[:16]))
+        self.files: dict[str, FileProgress] = self.read(params) if resume else {}
+        self.resumed = len(self.files)
+        self.fp = open(self.path, "a" if resume else "w", encoding="utf-8")
+        if self.fp.tell() == 0:
+            self.append({"params": params})
+
+    def read(self, params: str) -> dict[str, FileProgress]:
+        files: dict[str, FileProgress] = {}
+        try:
+            with open(self.path, encoding="utf-8") as f:
+                lines = f.readlines()
+        except OSError:
+            return files
+        for i, line in enumerate(lines):
+            try:
+                entry = json.loads(line)
+            except ValueError:  # 进程被结束时最后一行可能没有写完
+                continue
+            if i == 0:
+                if entry.get("params") != params:
+                    return files
+                continue
+            if "signature" in entry:
+                progress = files[entry["file"]] = FileProgress(entry["signature"], entry.get("frames_dir"))
+                progress.done = entry.get("done", False)
+            elif entry.get("file") in files:  # 同时开始的批处理可能各写了一行参数
+                ranges = files[entry["file"]].ranges
+                ranges[entry["start"]] = max(ranges.get(entry["start"], 0), entry["stop"])
+        return files
+
+    def append(self, entry: dict):
+        self.fp.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        self.fp.flush()
+
+    def progress(self, filename: str) -> FileProgress | None:
+        """filename 的记录, 输入文件改变后返回 None"""
+        progress = self.files.get(abspath(filename))
+        try:
+            if progress is not None and progress.signature == input_signature(filename):
+                return progress
+        except (OSError, KeyError):
+            pass
+        return None
+
+    def completed(self, filename: str) -> bool:
+        progress = self.progress(filename)
+        return progress is not None and progress.done
+
+    def saved_frames(self, filename: str) -> tuple[str, dict[int, int]] | None:
+        """逐帧输出中断时已保存的 (文件夹, 帧范围), 没有记录或文件夹已不存在时返回 None"""
+        progress = self.progress(filename)
+        if progress is None or progress.frames_dir is None or progress.done:
+            return None
+        frames_dir = join(self.output_dir, progress.frames_dir)
+        if not isdir(frames_dir):
+            return None
+        return frames_dir, progress.ranges
+
+    def start_frames(self, filename: str, frames_dir: str):
+        """记录 filename 的逐帧输出写入 frames_dir"""
+        progress = FileProgress(input_signature(filename), os.path.relpath(frames_dir, self.output_dir))
+        self.files[abspath(filename)] = progress
+        self.append({"file": abspath(filename), "signature": progress.signature, "frames_dir": progress.frames_dir})
+
+    def frames_saved(self, filename: str, start: int, stop: int):
+        """从 start 开始的任务已按顺序保存到 stop (不含)"""
+        progress = self.files.get(abspath(filename))
+        if progress is not None and stop > progress.ranges.get(start, start):
+            progress.ranges[start] = stop
+            self.append({"file": abspath(filename), "start": start, "stop": stop})
+
+    def mark_done(self, filename: str):
+        progress = self.files.get(abspath(filename))
+        frames_dir = progress.frames_dir if progress is not None else None
+        progress = self.files[abspath(filename)] = FileProgress(input_signature(filename), frames_dir, done=True)
+        self.append({"file": abspath(filename), "signature": progress.signature, "frames_dir": frames_dir,
+                     "done": True})
+
+    def close(self):
+        self.fp.close()
+
+    def finish(self):
+        """全部处理完成, 删除日志; 同时运行的相同参数的批处理可能已先删除"""
+        self.close()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
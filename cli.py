@@ -0,0 +1,309 @@
+"""
+cli.py
+无界面的命令行批量处理, 不导入 wx
+用法: python cli.py 输入文件/文件夹/压缩包或通配符... -o 输出文件夹 [-w webp[,gif,...]] [-n 1650] [-g 4] [-s 10] [-j 进程数]
+只有用到的功能才导入对应的模块 (多进程、检查点、渲染缓存、监视模式、再编码), 缩短启动到首帧的时间
+"""
+import argparse
+import sys
+from glob import iglob, has_magic
+from itertools import chain, islice
+from os.path import exists, isdir, basename
+from time import perf_counter
+from typing import Callable, Iterator, TYPE_CHECKING
+
+from PIL import Image
+
+import profiling
+from compositor import process_an_file, process_files, loop_period, snap_frame_count, group_by_size
+from glint import load_glint
+from ingest import iter_inputs, split_archive_path, DEFAULT_PATTERN
+from output import (OutputWay, OutputWays, EncoderSettings, FramesDirWriter, output_stacked_frames, write_frames,
+                    buffered, frames_for_output, is_frames_output, new_frames_dir)
+
+if TYPE_CHECKING:
+    from checkpoint import Checkpoint
+    from render_cache import RenderCache
+
+MAX_STACK_ITEMS = 16  # 单进程时尺寸相同的文件每次最多一起叠加的个数
+CHECKPOINT_INTERVAL = 1.0  # 单进程逐帧输出时把已保存的帧记入检查点的间隔 (秒)
+
+out_way_names = {
+    "gif": OutputWay.ONEFILE_GIF,
+    "apng": OutputWay.ONEFILE_APNG,
+    "webp": OutputWay.ONEFILE_WEBP,
+    "png": OutputWay.FRAMES_PNG,
+    "jpg": OutputWay.FRAMES_JPG,
+    "pack": OutputWay.RESOURCE_PACK,
+    "raw": OutputWay.RAW_RGBA,
+}
+
+
+def parse_ways(text: str) -> OutputWays:
+    """-w 的参数: 一种输出方式, 或逗号分隔的多种 (帧只生成一次, 同时交给各格式的写入器)"""
+    ways = []
+    for name in text.split(","):
+        way = out_way_names.get(name.strip())
+        if way is None:
+            raise argparse.ArgumentTypeError(f"未知的输出方式: {name} (可选 {'/'.join(out_way_names)})")
+        if way not in ways:
+            ways.append(way)
+    return ways[0] if len(ways) == 1 else ways
+
+
+def expand_inputs(patterns: list[str], member_pattern: str = DEFAULT_PATTERN, warn_missing: bool = True) \
+        -> Iterator[str]:
+    """惰性展开命令行给出的输入, 文件夹与压缩包按 member_pattern 过滤"""
+    for pattern in patterns:
+        if has_magic(pattern):
+            yield from iter_inputs(iglob(pattern, recursive=True), member_pattern)
+        elif exists(pattern) or split_archive_path(pattern) is not None:
+            yield from iter_inputs([pattern], member_pattern)
+        elif warn_missing:
+            print(f"找不到文件: {pattern}", file=sys.stderr)
+
+
+def parse_args(argv: list[str] | None = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="把一批图片覆盖上MC的附魔光效")
+    parser.add_argument("inputs", nargs="+",
+                        help="输入文件、文件夹 (递归)、zip/jar 压缩包或通配符 (支持 **); "
+                             "压缩包中的单个文件写作 压缩包!/成员路径")
+    parser.add_argument("-o", "--output", required=True, help="输出文件夹")
+    parser.add_argument("-w", "--way", type=parse_ways, default="webp",
+                        help="输出方式: gif/apng/webp 动图, png/jpg 每一帧, pack MC资源包, "
+                             "raw 原始帧存储 (可用 --reencode 再编码, 界面中可直接预览); "
+                             "逗号分隔多种时同时输出, 如 gif,webp,png (默认 webp)")
+    parser.add_argument("-n", "--frames", type=int, default=1650, help="输出总帧数, 20帧/s (默认 1650)")
+    parser.add_argument("-g", "--glint-scale", type=int, default=4, choices=range(2, 9), metavar="2-8",
+                        help="光效缩放 (默认 4)")
+    parser.add_argument("-s", "--input-scale", type=int, default=10, help="输入缩放 (默认 10)")
+    parser.add_argument("-f", "--filter", default=DEFAULT_PATTERN,
+                        help="文件夹与压缩包中要处理的文件, 含 / 时匹配相对路径, 否则匹配文件名 (默认 *.png)")
+    parser.add_argument("-j", "--workers", type=int,
+                        help="进程数, 大于 1 时使用多进程 (默认 1); 监视模式中为渲染线程数 (默认 CPU 数, 最多 4)")
+    parser.add_argument("--seamless", action="store_true", help="总帧数对齐到完整循环周期 (无缝循环)")
+    parser.add_argument("--png-compress", type=int, default=6, choices=range(0, 10), metavar="0-9",
+                        help="逐帧输出 png 时的压缩等级 (默认 6)")
+    parser.add_argument("--jpg-quality", type=int, default=75, help="逐帧输出 jpg 时的质量 1-95 (默认 75)")
+    parser.add_argument("--jpg-subsampling", choices=["4:4:4", "4:2:2", "4:2:0"], default="4:2:0",
+                        help="逐帧输出 jpg 时的色度抽样 (默认 4:2:0)")
+    parser.add_argument("--webp-lossless", action="store_true", help="webp 使用无损压缩")
+    parser.add_argument("--webp-quality", type=int, default=80, help="webp 质量 0-100, 无损时为压缩力度 (默认 80)")
+    parser.add_argument("--webp-method", type=int, default=0, choices=range(0, 7), metavar="0-6",
+                        help="webp 编码方法, 越大越慢、文件越小 (默认 0)")
+    parser.add_argument("--profile-report", metavar="PATH",
+                        help="结束时写出性能报告: 各阶段耗时、每个文件的帧率与字节数、峰值内存 (.json 或 .csv)")
+    parser.add_argument("--cprofile", metavar="PATH",
+                        help="用 cProfile 分析主进程并写出 .prof 文件 (多进程时渲染在工作进程中, 建议配合 -j 1)")
+    parser.add_argument("--no-cache", action="store_true",
+                        help="不使用渲染缓存, 重新处理所有文件 (默认跳过内容与参数都未改变的文件)")
+    parser.add_argument("--reencode", action="store_true",
+                        help="输入为 -w raw 输出的原始帧存储 (文件夹中匹配 *.raw), 直接编码为 -w 指定的格式, 不重新生成帧")
+    parser.add_argument("--watch", action="store_true",
+                        help="监视模式: 常驻运行, 输入改变后自动重新渲染, Ctrl+C 退出")
+    parser.add_argument("--debounce", type=float,
+                        help="监视模式中文件保持不变多少秒后才渲染 (默认使用 watch.py 中的 WATCH_DEBOUNCE)")
+    parser.add_argument("--no-resume", action="store_true",
+                        help="忽略上次中断时留下的检查点 (默认跳过已完成的文件, 逐帧输出时只补齐缺少的帧)")
+    return parser.parse_args(argv)
+
+
+def main(argv: list[str] | None = None) -> int:
+    args = parse_args(argv)
+    if args.profile_report:
+        profiling.enable()
+    if not args.cprofile:
+        code = run(args)
+    else:
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            code = profiler.runcall(run, args)
+        finally:
+            profiler.dump_stats(args.cprofile)
+    if args.profile_report:
+        profiling.write_report(args.profile_report)
+    return code
+
+
+def run(args: argparse.Namespace) -> int:
+    start = perf_counter()
+    if not isdir(args.output):
+        print(f"输出文件夹不存在: {args.output}", file=sys.stderr)
+        return 1
+    output_way = args.way
+    settings = EncoderSettings(png_compress_level=args.png_compress, jpg_quality=args.jpg_quality,
+                               jpg_subsampling=args.jpg_subsampling, webp_lossless=args.webp_lossless,
+                               webp_quality=args.webp_quality, webp_method=args.webp_method)
+    if args.reencode:
+        return reencode(args, output_way, settings, start)
+    frame_count = args.frames
+    glint = load_glint(args.glint_scale)
+    period = loop_period(glint.size)
+    if args.seamless:
+        frame_count = snap_frame_count(frame_count, period)
+    cache = None
+    if not args.no_cache:
+        from render_cache import RenderCache
+
+        cache = RenderCache(args.output, output_way, frame_count, args.glint_scale, args.input_scale, settings)
+    if args.watch:
+        return watch(args, output_way, frame_count, settings, cache)
+
+    filenames = expand_inputs(args.inputs, args.filter)
+    first = next(filenames, None)
+    if first is None:
+        print("没有要处理的文件", file=sys.stderr)
+        return 1
+    filenames = chain([first], filenames)
+    total_files = 0
+
+    def count(inputs: Iterator[str]) -> Iterator[str]:
+        nonlocal total_files
+        for filename in inputs:
+            total_files += 1
+            yield filename
+
+    filenames = count(filenames)
+    from checkpoint import Checkpoint
+
+    checkpoint = Checkpoint(args.output, output_way, frame_count, args.glint_scale, args.input_scale, settings,
+                            not args.no_resume)
+    if checkpoint.resumed:
+        print(f"从上次中断处继续, 检查点中有 {checkpoint.resumed} 个文件的记录")
+
+    try:
+        if (args.workers or 1) > 1:
+            from batch import render_batch
+
+            def report(filename: str, file_count: int, total_file: int, value: int, total: int):
+                cache_text = f"  {cache.progress_text()}" if cache is not None else ""
+                print(f"\r已完成文件: {file_count}/{total_file}  帧: {value}/{total}{cache_text}", end="", flush=True)
+
+            render_batch(filenames, args.output, output_way, frame_count, args.glint_scale, args.input_scale, report,
+                         args.workers, settings, cache, checkpoint=checkpoint)
+            print()
+        else:
+            first_frame = None
+            files_done = 0
+            rendered = frames_for_output(output_way, frame_count, period)  # 同时输出资源包时至少生成一个周期
+
+            def report(value: int):
+                nonlocal first_frame
+                if first_frame is None:
+                    first_frame = perf_counter() - start
+                    print(f"首帧耗时: {first_frame * 1000:.1f}ms")
+
+            try:
+                # 每次从输入中取一部分, 按尺寸分组后处理, 不必等待全部枚举完
+                # 逐帧输出时每个文件单独处理, 检查点记录已保存的帧, 中断后只补齐缺少的帧
+                while chunk := list(islice(filenames, MAX_STACK_ITEMS * 4)):
+                    todo = [filename for filename in chunk if not checkpoint.completed(filename)]
+                    if cache is not None:
+                        todo = [filename for filename in todo if not cache.lookup(filename)]
+                        print(cache.progress_text())
+                    files_done += len(chunk) - len(todo)
+                    if is_frames_output(output_way):
+                        for filename in todo:
+                            files_done += 1
+                            print(f"正在处理: {filename} ({files_done}/{total_files}+)")
+                            frames_dir = output_frames_resumable(filename, args, glint, frame_count, output_way,
+                                                                 settings, checkpoint, report)
+                            if cache is not None:
+                                cache.record(filename, [frames_dir])
+                            checkpoint.mark_done(filename)
+                        continue
+                    for group in group_by_size(todo, args.input_scale, MAX_STACK_ITEMS):
+                        for filename in group:
+                            files_done += 1
+                            print(f"正在处理: {filename} ({files_done}/{total_files}+)")
+                        frames = buffered(process_files(group, glint, rendered, args.input_scale))
+                        outputs = output_stacked_frames(list(map(basename, group)), args.output, frames, output_way,
+                                                        report, settings, period, frame_count)
+                        for filename, file_outputs in zip(group, outputs):
+                            if cache is not None:
+                                cache.record(filename, file_outputs)
+                            checkpoint.mark_done(filename)
+                checkpoint.finish()
+            finally:
+                checkpoint.close()
+                if cache is not None:
+                    cache.save()
+    except KeyboardInterrupt:
+        print("\n已中断, 用相同的参数再次运行即可从中断处继续", file=sys.stderr)
+        return 130
+    print(f"处理完成, 共 {total_files} 个文件, 耗时 {perf_counter() - start:.2f}s")
+    return 0
+
+
+def output_frames_resumable(filename: str, args: argparse.Namespace, glint: Image.Image, frame_count: int,
+                            output_way: OutputWay, settings: EncoderSettings, checkpoint: "Checkpoint",
+                            cbk: Callable[[int], None]) -> str:
+    """
+    单进程逐帧输出一个文件, 返回输出的文件夹
+    检查点中有上次中断时保存的帧时写入原来的文件夹, 只补齐缺少的帧;
+    已保存的帧每 CHECKPOINT_INTERVAL 秒, 以及每段帧写完或中断时记入检查点
+    """
+    from checkpoint import missing_ranges
+
+    saved = checkpoint.saved_frames(filename)
+    if saved is None:
+        frames_dir = new_frames_dir(basename(filename), args.output)
+        checkpoint.start_frames(filename, frames_dir)
+        ranges = [(0, frame_count)]
+    else:
+        frames_dir, done = saved
+        ranges = missing_ranges(done, frame_count)
+    for start, stop in ranges:
+        writer = FramesDirWriter(filename, frames_dir, output_way, start, settings)
+        last_saved = perf_counter()
+
+        def report(value: int):
+            nonlocal last_saved
+            cbk(value)
+            if perf_counter() - last_saved > CHECKPOINT_INTERVAL:
+                last_saved = perf_counter()
+                checkpoint.frames_saved(filename, start, start + value)
+
+        try:
+            write_frames(writer, buffered(process_an_file(filename, glint, frame_count, args.input_scale,
+                                                          start=start, stop=stop)), report)
+        finally:
+            checkpoint.frames_saved(filename, start, start + writer.written)
+    return frames_dir
+
+
+def reencode(args: argparse.Namespace, output_way: OutputWays, settings: EncoderSettings, start: float) -> int:
+    from framestore import encode_store, is_frame_store
+
+    total_files = 0
+    for path in expand_inputs(args.inputs, "*.raw"):
+        if not is_frame_store(path):
+            print(f"不是原始帧存储文件: {path}", file=sys.stderr)
+            continue
+        total_files += 1
+        print(f"正在编码: {path}")
+        encode_store(path, args.output, output_way, lambda _: None, settings)
+    print(f"处理完成, 共 {total_files} 个文件, 耗时 {perf_counter() - start:.2f}s")
+    return 0 if total_files else 1
+
+
+def watch(args: argparse.Namespace, output_way: OutputWays, frame_count: int, settings: EncoderSettings,
+          cache: "RenderCache | None") -> int:
+    from watch import Watcher, WATCH_DEBOUNCE, WATCH_WORKERS
+
+    list(expand_inputs(args.inputs, args.filter))  # 提示找不到的输入
+    watcher = Watcher(lambda: expand_inputs(args.inputs, args.filter, warn_missing=False), args.output, output_way,
+                      frame_count, args.glint_scale, args.input_scale, settings, args.workers or WATCH_WORKERS,
+                      WATCH_DEBOUNCE if args.debounce is None else args.debounce, cache)
+    print(f"正在监视输入的改变, 输出到 {args.output}, Ctrl+C 退出")
+    try:
+        watcher.run()
+    except KeyboardInterrupt:
+        print("已退出监视模式")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
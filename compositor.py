@@ -0,0 +1,198 @@
+"""
+compositor.py
+基于数组的光效叠加
+"""
+from math import gcd, lcm
+from typing import Callable, Iterator
+
+import numpy as np
+from PIL import Image
+
+import profiling
+from ingest import open_input
+
+
+FRAME_CACHE_LIMIT = 128 * 1024 * 1024  # 一个循环周期内的帧总大小不超过此值时缓存复用, 否则逐帧重新叠加
+STACK_ITEM_PIXELS = 96 * 96  # 同尺寸的图每张不超过这么多像素时堆叠为一张图叠加 (见 StackCompositor)
+
+
+def glint_offset(index: int, glint_size: tuple[int, int]) -> tuple[int, int]:
+    """第 index 帧光效层的裁剪起点, 每帧偏移 (-2, +2)"""
+    width, height = glint_size
+    return (-2 * index) % width, (2 * index) % height
+
+
+def loop_period(glint_size: tuple[int, int]) -> int:
+    """光效动画的循环周期 (帧), 之后的帧与之前完全相同"""
+    width, height = glint_size
+    return lcm(width // gcd(width, 2), height // gcd(height, 2))
+
+
+def snap_frame_count(frame_count: int, period: int) -> int:
+    """把总帧数对齐到最接近的整数个周期 (至少一个周期), 使动画首尾无缝衔接"""
+    return max(1, round(frame_count / period)) * period
+
+
+class GlintCompositor:
+    """
+    把光效层叠加到一张输入图上
+    光效层预先平铺为 2x2, 每帧的光效窗口是平铺数组上的零拷贝视图;
+    输入图的透明度在构造时取出一次, 遮罩缓冲逐帧复用, 每帧只分配一张输出图
+    """
+
+    def __init__(self, raw_image: Image.Image, glint: np.ndarray):
+        self.raw_image = raw_image.convert("RGBA")
+        self.raw_alpha = self.raw_image.getchannel("A")
+        self.size = self.raw_image.size
+        width, height = self.size
+        glint_height, glint_width = glint.shape[:2]
+        self.glint_size = (glint_width, glint_height)
+        # 输入图比光效层大时, 超出两倍光效层的部分不叠加 (与旧版 crop_and_paste 的行为一致)
+        self.tile = np.zeros((glint_height + max(glint_height, height),
+                              glint_width + max(glint_width, width), 4), np.uint8)
+        self.tile[:glint_height * 2, :glint_width * 2] = np.tile(glint, (2, 2, 1))
+        self.tile_buffer = memoryview(self.tile.reshape(-1))
+        self.stride = self.tile.shape[1] * 4
+        self.mask = Image.new("L", self.size)
+        self.period = loop_period(self.glint_size)
+
+    def window(self, x: int, y: int) -> Image.Image:
+        """平铺光效层上以 (x, y) 为起点的窗口, 与 self.tile 共享内存"""
+        offset = y * self.stride + x * 4
+        return Image.frombuffer("RGBA", self.size, self.tile_buffer[offset:], "raw", "RGBA", self.stride, 1)
+
+    def compose(self, x: int, y: int) -> Image.Image:
+        window = self.window(x, y)
+        # 遮罩 = 光效透明度 * 输入图透明度 / 255
+        self.mask.paste(0, (0, 0, *self.size))
+        self.mask.paste(self.raw_alpha, (0, 0), window)
+        enchanted = self.raw_image.copy()
+        enchanted.paste(window, (0, 0), self.mask)
+        return enchanted
+
+    def compose_frame(self, index: int) -> Image.Image:
+        return self.compose(*glint_offset(index, self.glint_size))
+
+
+class StackCompositor(GlintCompositor):
+    """
+    为多张尺寸相同的输入图叠加光效, 各图每帧共用同一个光效窗口
+    小图 (不超过 STACK_ITEM_PIXELS) 的开销主要在逐张调用上: 竖向堆叠后每帧只做一次遮罩计算和一次 paste, 再切分;
+    大图的开销在逐像素混合上: 逐张 paste 平铺光效层上的同一个零拷贝窗口 (始终在缓存中), 不复制窗口也不切分
+    """
+
+    def __init__(self, raw_images: list[Image.Image], glint: np.ndarray):
+        super().__init__(raw_images[0], glint)
+        width, height = self.size
+        self.count = len(raw_images)
+        self.item_size = self.size
+        self.stacked = width * height <= STACK_ITEM_PIXELS
+        if not self.stacked:
+            self.raw_images = [raw_image.convert("RGBA") for raw_image in raw_images]
+            self.raw_alphas = [raw_image.getchannel("A") for raw_image in self.raw_images]
+            return
+        self.size = (width, height * self.count)
+        self.raw_image = Image.new("RGBA", self.size)
+        for i, raw_image in enumerate(raw_images):
+            self.raw_image.paste(raw_image.convert("RGBA"), (0, i * height))
+        self.raw_alpha = self.raw_image.getchannel("A")
+        self.mask = Image.new("L", self.size)
+        # 每帧把光效窗口复制到每张图对应的位置, window_image 与 window_stack 共享内存
+        self.window_stack = np.empty((self.count, height, width, 4), np.uint8)
+        self.window_image = Image.frombuffer("RGBA", self.size, self.window_stack, "raw", "RGBA", 0, 1)
+
+    def compose(self, x: int, y: int) -> list[Image.Image]:
+        if not self.stacked:
+            window = self.window(x, y)
+            frames = []
+            for raw_image, raw_alpha in zip(self.raw_images, self.raw_alphas):
+                self.mask.paste(0, (0, 0, *self.size))
+                self.mask.paste(raw_alpha, (0, 0), window)
+                enchanted = raw_image.copy()
+                enchanted.paste(window, (0, 0), self.mask)
+                frames.append(enchanted)
+            return frames
+        width, height = self.item_size
+        self.window_stack[:] = self.tile[y:y + height, x:x + width]
+        self.mask.paste(0, (0, 0, *self.size))
+        self.mask.paste(self.raw_alpha, (0, 0), self.window_image)
+        enchanted = self.raw_image.copy()
+        enchanted.paste(self.window_image, (0, 0), self.mask)
+        return [enchanted.crop((0, i * height, width, (i + 1) * height)) for i in range(self.count)]
+
+    def compose_frame(self, index: int) -> list[Image.Image]:
+        return self.compose(*glint_offset(index, self.glint_size))
+
+
+def load_input(filename: str, scale: int) -> Image.Image:
+    with profiling.stage("load_input"):
+        raw_image = Image.open(open_input(filename)).convert("RGBA")
+        return raw_image.resize(tuple(map(lambda x: x * scale, raw_image.size)), resample=Image.Resampling.BOX)
+
+
+def input_size(filename: str, scale: int) -> tuple[int, int]:
+    """只读取文件头, 返回缩放后的尺寸"""
+    with Image.open(open_input(filename)) as image:
+        return image.width * scale, image.height * scale
+
+
+def group_by_size(filenames: list[str], scale: int, max_group: int) -> list[list[str]]:
+    """按缩放后的尺寸把文件分组, 每组最多 max_group 个, 保持原有顺序"""
+    groups: dict[tuple[int, int], list[list[str]]] = {}
+    for filename in filenames:
+        chunks = groups.setdefault(input_size(filename, scale), [[]])
+        if len(chunks[-1]) >= max_group:
+            chunks.append([])
+        chunks[-1].append(filename)
+    return [chunk for chunks in groups.values() for chunk in chunks]
+
+
+def process_an_file(filename: str, glint: Image.Image | np.ndarray, frame_count: int, scale: int,
+                    cbk: Callable[[int], None] | None = None, start: int = 0, stop: int | None = None) \
+        -> Iterator[Image.Image]:
+    """
+    逐帧生成第 start 到 stop (默认 frame_count) 帧, 只叠加一个循环周期内的帧, 之后按下标复用
+    cbk 的参数为已生成的帧数, 每帧调用一次; 进度通常由写入端汇报 (见 output.write_frames), 不需要时不传
+    """
+    raw_image = load_input(filename, scale)
+    compositor = GlintCompositor(raw_image, np.asarray(glint))
+    unique_count = min(frame_count, compositor.period)
+    cache_frames = unique_count * raw_image.width * raw_image.height * 4 <= FRAME_CACHE_LIMIT
+    unique_frames: dict[int, Image.Image] = {}
+    for i in range(start, frame_count if stop is None else stop):
+        if cbk is not None:
+            cbk(i + 1 - start)
+        index = i % unique_count
+        frame = unique_frames.get(index)
+        if frame is None:
+            with profiling.stage("compose"):
+                frame = compositor.compose_frame(index)
+            if cache_frames:
+                unique_frames[index] = frame
+        else:
+            profiling.count("frames_reused")
+        yield frame
+
+
+def process_files(filenames: list[str], glint: Image.Image | np.ndarray, frame_count: int, scale: int,
+                  cbk: Callable[[int], None] | None = None, start: int = 0, stop: int | None = None) \
+        -> Iterator[list[Image.Image]]:
+    """同 process_an_file, 但一次处理多张尺寸相同的输入图, 每次返回各输入图的同一帧"""
+    compositor = StackCompositor([load_input(filename, scale) for filename in filenames], np.asarray(glint))
+    width, height = compositor.size
+    unique_count = min(frame_count, compositor.period)
+    cache_frames = unique_count * width * height * 4 <= FRAME_CACHE_LIMIT
+    unique_frames: dict[int, list[Image.Image]] = {}
+    for i in range(start, frame_count if stop is None else stop):
+        if cbk is not None:
+            cbk(i + 1 - start)
+        index = i % unique_count
+        frames = unique_frames.get(index)
+        if frames is None:
+            with profiling.stage("compose_stack"):
+                frames = compositor.compose_frame(index)
+            if cache_frames:
+                unique_frames[index] = frames
+        else:
+            profiling.count("frames_reused", len(frames))
+        yield frames
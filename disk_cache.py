@@ -0,0 +1,30 @@
+"""
+disk_cache.py
+磁盘缓存目录 (光效层、缩略图) 的公共操作: 原子写入一项, 按最后使用时间淘汰
+读取缓存的一方命中时用 os.utime 更新修改时间, 淘汰时以修改时间为最后使用时间
+"""
+import os
+from os.path import dirname, isdir, join, getmtime, getsize
+from typing import BinaryIO, Callable
+
+
+def write_cache(path: str, write: Callable[[BinaryIO], None]):
+    """调用 write 写入缓存项 path, 先写到临时文件再替换, 同时运行的进程不会读到写了一半的文件"""
+    os.makedirs(dirname(path), exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, "wb") as f:
+        write(f)
+    os.replace(temp_path, path)
+
+
+def evict_cache(cache_dir: str, suffix: str, limit: int):
+    """按最后使用时间删除 cache_dir 中以 suffix 结尾的旧缓存, 直到它们的总大小不超过 limit"""
+    if not isdir(cache_dir):
+        return
+    entries = [join(cache_dir, name) for name in os.listdir(cache_dir) if name.endswith(suffix)]
+    entries.sort(key=getmtime)
+    total = sum(map(getsize, entries))
+    while entries and total > limit:
+        path = entries.pop(0)
+        total -= getsize(path)
+        os.remove(path)
@@ -0,0 +1,100 @@
+"""
+framestore.py
+原始帧存储: 把生成好的帧按原始 RGBA 数据依次写入一个文件, 读取时内存映射
+文件头为 魔数, 宽, 高, 帧数, 帧率 (小端 uint32), 补齐到 RAW_HEADER_SIZE 字节, 之后是 帧数 x 高 x 宽 x 4 字节的像素
+读取时每一帧都是映射区域的切片, 不需要解码也不复制, 可以直接交给任意写入器再编码, 或用于预览
+"""
+import struct
+from os.path import basename
+from time import perf_counter
+from typing import Callable, Iterator
+
+import numpy as np
+from PIL import Image
+
+from output import FileWriter, FPS, OutputWays, EncoderSettings, open_writer, write_frames, record_outputs
+
+RAW_MAGIC = b"GLNTRAW\x01"
+RAW_HEADER = struct.Struct("<8sIIII")  # 魔数, 宽, 高, 帧数, 帧率
+RAW_HEADER_SIZE = 64  # 像素数据从这里开始, 按 64 字节对齐
+
+
+class RawFrameWriter(FileWriter):
+    """逐帧写入原始帧存储, 帧数在关闭时回填到文件头"""
+
+    def __init__(self, path: str, fps: int = FPS):
+        super().__init__(path)
+        self.fps = fps
+        self.size = (0, 0)
+
+    def header(self) -> bytes:
+        return RAW_HEADER.pack(RAW_MAGIC, *self.size, self.written, self.fps).ljust(RAW_HEADER_SIZE, b"\0")
+
+    def write(self, frame: Image.Image):
+        if self.written == 0:
+            self.size = frame.size
+            self.fp.write(self.header())
+        if frame.size != self.size:
+            raise ValueError("原始帧存储中的帧尺寸必须相同")
+        self.fp.write((frame if frame.mode == "RGBA" else frame.convert("RGBA")).tobytes())
+        self.written += 1
+
+    def close(self):
+        self.fp.seek(0)
+        self.fp.write(self.header())
+        super().close()
+
+
+class RawFrameStore:
+    """内存映射地读取原始帧存储, frames 为形状 (帧数, 高, 宽, 4) 的只读数组"""
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, width, height, self.count, self.fps = RAW_HEADER.unpack(f.read(RAW_HEADER.size))
+        if magic != RAW_MAGIC:
+            raise ValueError(f"不是原始帧存储文件: {path}")
+        self.size = (width, height)
+        shape = (self.count, height, width, 4)
+        self.frames: np.ndarray = np.memmap(path, np.uint8, "r", RAW_HEADER_SIZE, shape) if self.count else \
+            np.empty(shape, np.uint8)
+
+    def frame(self, index: int) -> np.ndarray:
+        return self.frames[index]
+
+    def image(self, index: int) -> Image.Image:
+        """共用映射内存的只读图像"""
+        return Image.frombuffer("RGBA", self.size, self.frames[index], "raw", "RGBA", 0, 1)
+
+    def images(self) -> Iterator[Image.Image]:
+        for index in range(self.count):
+            yield self.image(index)
+
+    def close(self):
+        self.frames = np.empty((0, self.size[1], self.size[0], 4), np.uint8)
+
+
+def is_frame_store(path: str) -> bool:
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(RAW_MAGIC)) == RAW_MAGIC
+    except OSError:
+        return False
+
+
+def encode_store(path: str, output_dir: str, output_way: OutputWays, cbk: Callable[[int], None],
+                 settings: EncoderSettings | None = None) -> list[str]:
+    """
+    把原始帧存储再编码为 output_way (可以是多种, 同时编码), 不重新生成帧; 返回写出的文件或文件夹
+    输出按存储的文件名命名, 与直接渲染时一样视为 名称.png: 逐帧输出的文件夹名为 名称.png,
+    与 APNG 动图同时输出时由 open_writer 避开其路径
+    """
+    start = perf_counter()
+    store = RawFrameStore(path)
+    try:
+        writer = open_writer(basename(path).rsplit(".", 1)[0] + ".png", output_dir, output_way, settings)
+        write_frames(writer, store.images(), cbk)
+        record_outputs(basename(path), writer, start)
+        return writer.outputs()
+    finally:
+        store.close()
@@ -0,0 +1,67 @@
+"""
+glint.py
+附魔光效层的生成
+"""
+import hashlib
+import os
+from os.path import join, isfile
+
+import numpy as np
+from PIL import Image, ImageFilter, ImageEnhance
+
+import profiling
+from disk_cache import write_cache, evict_cache
+
+GLINT_PATH = "enchanted_glint_item.png"
+GLINT_BLUR_RADIUS = 3
+GLINT_BRIGHTNESS = 1.2
+GLINT_CACHE_DIR = join("cache", "glint")
+GLINT_CACHE_LIMIT = 256 * 1024 * 1024  # 光效层缓存的最大字节数 (见 disk_cache.evict_cache)
+
+
+def glint_alpha(rgb: np.ndarray) -> np.ndarray:
+    """按颜色计算光效透明度, (164, 84, 255) 到 (26, 8, 48) 映射为不透明到透明"""
+    rgb = rgb.astype(np.float64)
+    alpha = 255 - np.trunc(((112 - rgb[..., 0]) / 138 + (68 - rgb[..., 1]) / 76 + (159 - rgb[..., 2]) / 207) * 85)
+    return np.clip(alpha, 0, 255).astype(np.uint8)
+
+
+def build_glint(scale: int, blur_radius: float = GLINT_BLUR_RADIUS, brightness: float = GLINT_BRIGHTNESS) \
+        -> tuple[Image.Image, np.ndarray]:
+    """生成处理好的光效层, 返回 (RGBA图像, 形状为 (H, W, 4) 的连续uint8数组)"""
+    cover = np.array(Image.open(GLINT_PATH).convert("RGBA"))
+    cover[..., 3] = glint_alpha(cover[..., :3])
+    glint_cover = Image.fromarray(cover)
+    glint_cover = glint_cover.resize(tuple(map(lambda x: x * scale, glint_cover.size)))
+    glint_cover = glint_cover.filter(ImageFilter.GaussianBlur(blur_radius))
+    glint_cover = ImageEnhance.Brightness(glint_cover).enhance(brightness)
+    glint_array = np.array(glint_cover)
+    glint_array[..., 3] //= 2
+    return Image.fromarray(glint_array), glint_array
+
+
+def glint_cache_key(scale: int, blur_radius: float, brightness: float) -> str:
+    with open(GLINT_PATH, "rb") as f:
+        source_hash = hashlib.sha1(f.read()).hexdigest()
+    return f"{source_hash}_{scale}_{blur_radius}_{brightness}"
+
+
+def load_cached_glint(scale: int, blur_radius: float = GLINT_BLUR_RADIUS, brightness: float = GLINT_BRIGHTNESS,
+                      cache_dir: str = GLINT_CACHE_DIR) -> tuple[Image.Image, np.ndarray]:
+    """同 build_glint, 但优先从磁盘缓存以内存映射方式读取, 未命中时生成并写入缓存"""
+    cache_path = join(cache_dir, glint_cache_key(scale, blur_radius, brightness) + ".npy")
+    if isfile(cache_path):
+        with profiling.stage("load_glint"):
+            os.utime(cache_path)
+            glint_array = np.load(cache_path, mmap_mode="r")
+            height, width = glint_array.shape[:2]
+            return Image.frombuffer("RGBA", (width, height), glint_array, "raw", "RGBA", 0, 1), glint_array
+    with profiling.stage("build_glint"):
+        glint_cover, glint_array = build_glint(scale, blur_radius, brightness)
+        write_cache(cache_path, lambda f: np.save(f, glint_array))
+        evict_cache(cache_dir, ".npy", GLINT_CACHE_LIMIT)
+    return glint_cover, glint_array
+
+
+def load_glint(scale: int) -> Image.Image:
+    return load_cached_glint(scale)[0]
@@ -0,0 +1,100 @@
+"""
+ingest.py
+输入文件的枚举与读取
+输入可以是单个文件、文件夹 (递归) 或 zip/jar 压缩包; 压缩包中的文件用 "压缩包路径!/成员路径" 表示,
+直接从压缩包中读取, 不解压到磁盘
+"""
+import os
+import zipfile
+from fnmatch import fnmatch
+from functools import lru_cache
+from io import BytesIO
+from os.path import isdir, isfile, join, relpath
+from typing import BinaryIO, Iterable, Iterator
+
+ARCHIVE_SEPARATOR = "!/"
+ARCHIVE_SUFFIXES = (".zip", ".jar")
+DEFAULT_PATTERN = "*.png"
+
+
+def split_archive_path(path: str) -> tuple[str, str] | None:
+    """把 "压缩包路径!/成员路径" 拆为 (压缩包路径, 成员路径), 不是压缩包成员时返回 None"""
+    if ARCHIVE_SEPARATOR not in path:
+        return None
+    archive, member = path.split(ARCHIVE_SEPARATOR, 1)
+    return archive, member
+
+
+def is_archive(path: str) -> bool:
+    return path.lower().endswith(ARCHIVE_SUFFIXES) and isfile(path)
+
+
+@lru_cache(maxsize=8)
+def open_archive(path: str, mtime_ns: int, pid: int) -> zipfile.ZipFile:
+    """
+    每个进程中同一个压缩包只打开一次 (只读取一次中央目录), 文件改变后重新打开;
+    fork 出的子进程不能与父进程共用文件偏移, 因此按进程号区分
+    """
+    return zipfile.ZipFile(path)
+
+
+def archive(path: str) -> zipfile.ZipFile:
+    return open_archive(path, os.stat(path).st_mtime_ns, os.getpid())
+
+
+def open_input(path: str) -> BinaryIO:
+    """打开输入文件, 压缩包成员读入内存后返回"""
+    split = split_archive_path(path)
+    if split is None:
+        return open(path, "rb")
+    archive_path, member = split
+    return BytesIO(archive(archive_path).read(member))
+
+
+def input_signature(path: str) -> str:
+    """随输入文件内容改变的签名 (修改时间与大小; 压缩包成员还包括 CRC), 用于缓存键"""
+    split = split_archive_path(path)
+    if split is None:
+        stat = os.stat(path)
+        return f"{stat.st_mtime_ns}|{stat.st_size}"
+    archive_path, member = split
+    info = archive(archive_path).getinfo(member)
+    return f"{os.stat(archive_path).st_mtime_ns}|{info.CRC}|{info.file_size}"
+
+
+def matches(relative_path: str, pattern: str) -> bool:
+    """pattern 含 "/" 时匹配相对路径, 否则只匹配文件名"""
+    relative_path = relative_path.replace(os.sep, "/")
+    if "/" in pattern:
+        return fnmatch(relative_path, pattern)
+    return fnmatch(relative_path.rsplit("/", 1)[-1], pattern)
+
+
+def iter_archive(path: str, pattern: str) -> Iterator[str]:
+    for info in archive(path).infolist():
+        if not info.is_dir() and matches(info.filename, pattern):
+            yield path + ARCHIVE_SEPARATOR + info.filename
+
+
+def iter_dir(path: str, pattern: str) -> Iterator[str]:
+    """逐个文件夹遍历, 每个文件夹中按名称排序; 文件夹中的压缩包不展开"""
+    for root, dirs, files in os.walk(path):
+        dirs.sort()
+        for name in sorted(files):
+            file_path = join(root, name)
+            if matches(relpath(file_path, path), pattern):
+                yield file_path
+
+
+def iter_inputs(paths: Iterable[str], pattern: str = DEFAULT_PATTERN) -> Iterator[str]:
+    """
+    惰性展开输入: 文件夹递归遍历, zip/jar 压缩包列出其中的成员, 都按 pattern 过滤;
+    直接给出的普通文件不过滤
+    """
+    for path in paths:
+        if isdir(path):
+            yield from iter_dir(path, pattern)
+        elif is_archive(path):
+            yield from iter_archive(path, pattern)
+        elif isfile(path) or split_archive_path(path) is not None:
+            yield path
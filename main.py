@@ -1,40 +1,37 @@
 from dataclasses import dataclass
-from enum import Enum
-from os import listdir, mkdir
-from os.path import isfile, basename, join, isdir
+from itertools import islice
+from os import cpu_count, environ
+from os.path import basename, join, isdir
 from threading import Thread
 from time import perf_counter
 from typing import Callable
 
 import wx
-from PIL import Image, ImageFilter, ImageEnhance
 
-from widget import CenteredStaticText, ft, LabelTextCtrl, LabelSpinCtrl, LabelChoice, FormatedText
+import profiling
+from batch import render_batch, RenderJob, JobCancelled
+from checkpoint import Checkpoint
+from compositor import loop_period, snap_frame_count
+from glint import load_glint
+from ingest import iter_inputs
+from framestore import RawFrameStore
+from output import OutputWay, OutputWays, FPS
+from output_browser import OutputDirScanner, OutputEntry
+from preview import PreviewDecoder, LRUCache, open_frame_source
+from progress import ProgressChannel
+from render_cache import RenderCache
+from thumbnail import ThumbnailLoader, THUMBNAIL_SIZE, THUMBNAIL_BATCH
+from widget import CenteredStaticText, ft, LabelTextCtrl, LabelSpinCtrl, LabelCheckList, FormatedText
 
 DEBUG = False
+PREVIEW_BITMAP_CACHE = 64 * 1024 * 1024  # 预览时缓存的位图最多占用的字节数
+PROGRESS_POLL_INTERVAL = 100  # 界面读取处理进度的间隔 (毫秒)
 
 
 @dataclass
 class AssetItem:
     file_path: str
-    icon: wx.Bitmap
-
-
-class OutputWay(Enum):
-    ONEFILE_GIF = 0
-    ONEFILE_APNG = 1
-    ONEFILE_WEBP = 2
-    FRAMES_PNG = 3
-    FRAMES_JPG = 4
-
-
-end_fix_trans_map = {
-    OutputWay.ONEFILE_GIF: "gif",
-    OutputWay.ONEFILE_APNG: "png",
-    OutputWay.ONEFILE_WEBP: "webp",
-    OutputWay.FRAMES_PNG: "png",
-    OutputWay.FRAMES_JPG: "jpg"
-}
+    image: int = 0  # 在图像列表中的序号, 0 为占位图标
 
 
 class FileDropTarget(wx.FileDropTarget):
@@ -48,124 +45,57 @@ class FileDropTarget(wx.FileDropTarget):
         return True
 
 
-def load_glint(scale: int):
-    # (164, 84, 255) to (26, 8, 48) (79, 37, 129)
-    def convert_as_alpha(point: tuple[int, int, int, int]):
-        return point[0], point[1], point[2], 255 - int(
-            ((112 - point[0]) / 138 + (68 - point[1]) / 76 + (159 - point[2]) / 207) * 85)
-
-    glint_cover = Image.open(join("enchanted_glint_item.png")).convert("RGBA")
-    # noinspection PyTypeChecker
-    [[glint_cover.putpixel((x, y), convert_as_alpha(glint_cover.getpixel((x, y)))) for x in range(glint_cover.width)]
-     for y in range(glint_cover.height)]
-    glint_cover = glint_cover.resize(tuple(map(lambda x: x * scale, glint_cover.size)))
-    glint_cover = glint_cover.filter(ImageFilter.GaussianBlur(3))
-    glint_cover = ImageEnhance.Brightness(glint_cover).enhance(1.2)
-    glint_cover = Image.merge("RGBA", [*glint_cover.split()[:3], glint_cover.getchannel("A").point(lambda x: x // 2)])
-    return glint_cover
-
-
-def crop_and_paste(raw_image: Image.Image, glint: Image.Image, crop_start_x: int, crop_start_y: int, crop_stop_x: int,
-                   crop_stop_y: int, paste_x: int, paste_y: int):
-    cropped_glint: Image.Image = glint.crop((crop_start_x, crop_start_y, crop_stop_x, crop_stop_y)).convert("RGBA")
-    mask: Image.Image = Image.new("L", cropped_glint.size)
-    mask.paste(cropped_glint.getchannel("A"), (0, 0), raw_image.crop(
-        (paste_x, paste_y, paste_x + cropped_glint.width, paste_y + cropped_glint.height)).getchannel("A"))
-    raw_image.paste(cropped_glint, (paste_x, paste_y), mask)
-
-
-def process_an_file(filename: str, glint: Image.Image, frame_count: int, scale: int, cbk: Callable[[int], None]) -> \
-        list[Image]:
-    raw_image = Image.open(filename).convert("RGBA")
-    raw_image = raw_image.resize(tuple(map(lambda x: x * scale, raw_image.size)), resample=Image.Resampling.BOX)
-    frames = []
-    x_offset = 0
-    y_offset = 0
-    width, height = glint.size
-    for i in range(0, frame_count):
-        cbk(i + 1)
-        enchanted = raw_image.copy()
-        crop_start_x, crop_start_y = x_offset % width, y_offset % height
-        crop_stop_x, crop_stop_y = crop_start_x + enchanted.width, crop_start_y + enchanted.height
-
-        if frame_count == 1:
-            enchanted.show()
-        crop_and_paste(enchanted, glint, crop_start_x, crop_start_y, min(crop_stop_x, width), min(crop_stop_y, height),
-                       0, 0)
-        if crop_start_x + enchanted.width > width and crop_start_y + enchanted.height > height:
-            crop_and_paste(enchanted, glint, 0, 0, crop_stop_x - width, crop_stop_y - height,
-                           enchanted.width - (crop_stop_x - width), enchanted.height - (crop_stop_y - height))
-        if crop_start_x + enchanted.width > width:
-            crop_and_paste(enchanted, glint, 0, crop_start_y, crop_stop_x - width, min(crop_stop_y, height),
-                           enchanted.width - (crop_stop_x - width), 0)
-        if crop_start_y + enchanted.height > height:
-            crop_and_paste(enchanted, glint, crop_start_x, 0, min(crop_stop_x, width), crop_stop_y - height,
-                           0, enchanted.height - (crop_stop_y - height))
-        frames.append(enchanted)
-        x_offset += -2
-        y_offset += 2
-    return frames
-
-
-def output_frames(filename: str, output_dir: str, frames: list[Image.Image], output_way: OutputWay,
-                  cbk: Callable[[int], None]):
-    if output_way in [OutputWay.ONEFILE_GIF, OutputWay.ONEFILE_APNG, OutputWay.ONEFILE_WEBP]:
-        end_fix: str = end_fix_trans_map[output_way]
-        frames[0].save(join(output_dir, basename(filename).split(".")[0] + "." + end_fix), end_fix.upper(),
-                       save_all=True, append_images=frames, duration=1000 / 20, loop=0)
-    elif output_way in [OutputWay.FRAMES_PNG, OutputWay.FRAMES_JPG]:
-        end_fix: str = end_fix_trans_map[output_way]
-        if isdir(join(output_dir, filename)):
-            counter = 1
-            while True:
-                if not isdir(join(output_dir, filename + f" ({counter})")):
-                    dir_name = join(output_dir, filename + f" ({counter})")
-                    break
-        else:
-            dir_name = join(output_dir, filename)
-        mkdir(dir_name)
-        for i, frame in enumerate(frames):
-            cbk(i + 1)
-            frame.save(join(dir_name, f"{basename(filename).split('.')[0]}_{i}.{end_fix}"), end_fix.upper())
-    else:
-        raise ValueError("Invalid output way")
-
-
 class GUI(wx.Frame):
     def __init__(self, parent=None):
         wx.Frame.__init__(self, parent, title="MC附魔光效叠加器", size=(800, 700))
-        self.last_progress_upt = perf_counter()
         self.out_panel = wx.Panel(self)
         self.chs_panel = wx.Panel(self.out_panel)
         self.file_dropper = CenteredStaticText(self.chs_panel, label="拖放文件到这里")
-        self.file_dropper.SetDropTarget(FileDropTarget(self.file_dropper, self.add_files_to_list))
+        self.file_dropper.SetDropTarget(FileDropTarget(self.file_dropper, self.add_inputs))
         self.file_chooser = wx.FilePickerCtrl(self.chs_panel,
                                               message="选择要处理的文件",
                                               wildcard="*.*",
                                               style=wx.FLP_USE_TEXTCTRL | wx.FLP_FILE_MUST_EXIST)
         self.add_btn = wx.Button(self.chs_panel, label="添加")
-        self.ready_assets: list[str] = []
-        self.ready_assets_icons: list[wx.Bitmap] = []
-        self.ready_assets_images = wx.ImageList(64, 64)
+        # 列表项的 ItemData 为 ready_assets 的键; 删除的项目留下的图像列表位置记入 free_images 以便复用
+        self.ready_assets: dict[int, AssetItem] = {}
+        self.next_asset_id = 0
+        self.free_images: list[int] = []
+        self.ready_assets_images = wx.ImageList(THUMBNAIL_SIZE, THUMBNAIL_SIZE)
+        self.ready_assets_images.Add(wx.ArtProvider.GetBitmap(wx.ART_MISSING_IMAGE, wx.ART_OTHER,
+                                                              (THUMBNAIL_SIZE, THUMBNAIL_SIZE)))
         self.ready_assets_lc = wx.ListCtrl(self.chs_panel, style=wx.LC_ICON)
         self.ready_assets_lc.AssignImageList(self.ready_assets_images, wx.IMAGE_LIST_NORMAL)
+        self.thumbnail_loader = ThumbnailLoader(lambda batch: wx.CallAfter(self.on_thumbnails_loaded, batch))
 
         self.proc_panel = wx.Panel(self.out_panel)
         self.out_dir_chs_btn = wx.DirPickerCtrl(self.proc_panel,
                                                 message="选择输出文件夹",
                                                 style=wx.DD_NEW_DIR_BUTTON | wx.DD_DIR_MUST_EXIST)
         self.out_dir_tc = LabelTextCtrl(self.proc_panel, "输出到: ", "")
-        self.out_way_chooser = LabelChoice(self.proc_panel, "输出方式: ")
+        self.out_way_chooser = LabelCheckList(self.proc_panel, "输出方式: ")
         self.out_way_chooser.Append("输出GIF动图 (掉san)")
         self.out_way_chooser.Append("输出PNG动图 (无损)")
         self.out_way_chooser.Append("输出WEBP动图 (微损)")
         self.out_way_chooser.Append("输出每一帧 (png)")
         self.out_way_chooser.Append("输出每一帧 (jpg)")
+        self.out_way_chooser.Append("输出MC资源包 (竖向拼接材质+mcmeta)")
+        self.out_way_chooser.Append("输出原始帧存储 (raw, 可再编码, 预览无需解码)")
         self.frames_chs = LabelSpinCtrl(self.proc_panel, value="1650", label="输出总帧数 (20帧/s): ", min_=1,
                                         max_=114514)
         self.glint_scale = LabelSpinCtrl(self.proc_panel, value="4", label="光效缩放: ", min_=2, max_=8)
         self.input_scale = LabelSpinCtrl(self.proc_panel, value="10", label="输入缩放: ", min_=1, max_=20)
+        self.workers_chs = LabelSpinCtrl(self.proc_panel, value=str(cpu_count() or 1), label="进程数: ", min_=1,
+                                         max_=64)
+        self.seamless_loop = wx.CheckBox(self.proc_panel, label="总帧数对齐到完整循环周期 (无缝循环)")
         self.start_process_btn = wx.Button(self.proc_panel, label="开始处理")
+        self.pause_btn = wx.Button(self.proc_panel, label="暂停")
+        self.cancel_btn = wx.Button(self.proc_panel, label="取消")
+        self.pause_btn.Disable()
+        self.cancel_btn.Disable()
+        self.job: RenderJob | None = None
+        self.progress = ProgressChannel()
+        self.progress_timer = wx.Timer(self)
         self.out_shower = AniPhotosViewer(self.proc_panel)
 
         self.progress_panel = wx.Panel(self)
@@ -197,8 +127,16 @@ class GUI(wx.Frame):
         proc_sizer.Add(self.glint_scale, 0, wx.EXPAND)
         proc_sizer.AddSpacer(1)
         proc_sizer.Add(self.input_scale, 0, wx.EXPAND)
+        proc_sizer.AddSpacer(1)
+        proc_sizer.Add(self.workers_chs, 0, wx.EXPAND)
+        proc_sizer.AddSpacer(1)
+        proc_sizer.Add(self.seamless_loop, 0, wx.EXPAND)
         proc_sizer.AddSpacer(2)
-        proc_sizer.Add(self.start_process_btn, 0, wx.EXPAND)
+        job_sizer = wx.BoxSizer(wx.HORIZONTAL)
+        job_sizer.Add(self.start_process_btn, 1, wx.EXPAND)
+        job_sizer.Add(self.pause_btn, 0, wx.EXPAND | wx.LEFT, 2)
+        job_sizer.Add(self.cancel_btn, 0, wx.EXPAND | wx.LEFT, 2)
+        proc_sizer.Add(job_sizer, 0, wx.EXPAND)
         proc_sizer.AddSpacer(2)
         proc_sizer.Add(self.out_shower, 1, wx.EXPAND)
         self.proc_panel.SetSizer(proc_sizer)
@@ -223,81 +161,164 @@ class GUI(wx.Frame):
         self.file_dropper.SetFont(ft(32))
         self.start_process_btn.SetFont(ft(16))
         self.start_process_btn.Bind(wx.EVT_BUTTON, self.start_process)
+        self.pause_btn.Bind(wx.EVT_BUTTON, self.toggle_pause)
+        self.Bind(wx.EVT_TIMER, self.poll_progress, self.progress_timer)
+        self.cancel_btn.Bind(wx.EVT_BUTTON, lambda _: self.job.cancel())
         self.ready_assets_lc.Bind(wx.EVT_LIST_ITEM_RIGHT_CLICK, self.on_ready_item_menu)
-        self.add_btn.Bind(wx.EVT_BUTTON, lambda _: self.add_files_to_list([self.file_chooser.GetPath()]))
+        self.add_btn.Bind(wx.EVT_BUTTON, lambda _: self.add_inputs([self.file_chooser.GetPath()]))
         self.out_dir_chs_btn.Bind(wx.EVT_DIRPICKER_CHANGED,
                                   lambda _: self.out_dir_tc.SetValue(self.out_dir_chs_btn.GetPath()))
+        self.out_dir_tc.text.Bind(wx.EVT_TEXT, self.on_output_dir_changed)
         self.SetBackgroundColour(self.file_dropper.GetBackgroundColour())
         if DEBUG:
             self.out_dir_tc.SetValue(r"D:\Desktop\114514")
-            self.out_way_chooser.text.SetSelection(2)
+            self.out_way_chooser.text.Check(2)
             self.frames_chs.SetValue("300")
 
-    def start_process(self, _):
-        Thread(target=self.process_frames, args=(), daemon=True).start()
-
-    def process_frames(self):
+    def on_output_dir_changed(self, _):
+        """输出文件夹改变后立即在预览中显示其中的输出, 处理中写出的文件随后陆续出现"""
         output_dir = self.out_dir_tc.GetValue()
-        if self.out_way_chooser.GetSelection() == -1:
+        if isdir(output_dir):
+            self.out_shower.load_dir(output_dir)
+
+    def start_process(self, _):
+        """在界面线程中检查并读取设置, 处理在后台线程中进行, 进度由 progress_timer 定时读取"""
+        if self.job is not None:
+            return
+        # 勾选多种时帧只生成一次, 同时写出各种格式
+        output_ways = [OutputWay(index) for index in self.out_way_chooser.GetCheckedItems()]
+        if not output_ways:
             wx.MessageBox("请选择输出方式", "错误", wx.ICON_ERROR)
             return
-        output_way = OutputWay(self.out_way_chooser.GetSelection())
+        output_dir = self.out_dir_tc.GetValue()
         if not isdir(output_dir):
             wx.MessageBox("输出文件夹不存在", "错误", wx.ICON_ERROR)
             return
-        frame_count = self.frames_chs.GetValue()
-        glint_scale = self.glint_scale.GetValue()
-        input_scale = self.input_scale.GetValue()
-
-        glint = load_glint(glint_scale)
-        files_count = len(self.ready_assets)
-        for i, filename in enumerate(self.ready_assets):
-            file_basename = basename(filename)
-            print("正在处理: " + filename)
-            self.update_progress(file_basename, i, files_count, True, 0, frame_count, True)
-            frames = process_an_file(filename, glint, frame_count, input_scale,
-                                     lambda x: self.update_progress(file_basename, i, files_count, True, x,
-                                                                    frame_count))
-            print("正在保存: " + basename(filename))
-            self.update_progress(file_basename, i, files_count, False, 0, -1, True)
-            output_frames(basename(filename), output_dir, frames, output_way,
-                          lambda x: self.update_progress(file_basename, i, files_count, False, x, frame_count))
-        self.finish_progress("无", files_count, frame_count)
-        self.out_shower.load_dir(output_dir)
-        wx.MessageBox("处理完成", "处理完成", wx.ICON_INFORMATION)
-        wx.CallAfter(self.ready_assets_lc.ClearAll)
-        wx.CallAfter(self.ready_assets.clear)
-        wx.CallAfter(self.ready_assets_icons.clear)
-
-    def update_progress(self, filename: str, file_count: int, total_file: int, gen_or_save: bool, value: int,
-                        total: int, now: bool = False):
-        if not perf_counter() - self.last_progress_upt > 0.1:
-            if not now:
-                return
-        self.last_progress_upt = perf_counter()
-        self.tip_text.format(filename, file_count, total_file, gen_or_save, value, total)
-        if self.progress_bar_file.GetValue() != file_count:
-            self.progress_bar_file.SetRange(total_file)
-            self.progress_bar_file.SetValue(file_count)
-        self.progress_bar_frame.SetRange(total)
-        self.progress_bar_frame.SetValue(value)
-
-    def finish_progress(self, filename: str, total_file: int, total: int):
-        self.tip_text.finish(filename, total_file, total)
+        self.job = RenderJob()
+        self.progress = ProgressChannel()
+        self.start_process_btn.Disable()
+        self.pause_btn.SetLabel("暂停")
+        self.pause_btn.Enable()
+        self.cancel_btn.Enable()
+        self.progress_timer.Start(PROGRESS_POLL_INTERVAL)
+        Thread(target=self.process_frames, daemon=True,
+               args=(self.job, self.progress, [item.file_path for item in self.ready_assets.values()], output_dir,
+                     output_ways[0] if len(output_ways) == 1 else output_ways, self.frames_chs.GetValue(),
+                     self.glint_scale.GetValue(), self.input_scale.GetValue(), self.seamless_loop.GetValue(),
+                     self.workers_chs.GetValue())).start()
+
+    def process_frames(self, job: RenderJob, progress: ProgressChannel, filenames: list[str], output_dir: str,
+                       output_way: OutputWays, frame_count: int, glint_scale: int, input_scale: int, seamless: bool,
+                       workers: int):
+        """在后台线程中运行, 不直接操作界面: 进度写入 progress, 结束后通过 wx.CallAfter 交给 job_finished"""
+        status = "error"
+        try:
+            progress.post(phase="加载光效")
+            glint = load_glint(glint_scale)
+            period = loop_period(glint.size)
+            if seamless:
+                frame_count = snap_frame_count(frame_count, period)
+            cache = RenderCache(output_dir, output_way, frame_count, glint_scale, input_scale)
+            checkpoint = Checkpoint(output_dir, output_way, frame_count, glint_scale, input_scale)
+            # 帧边生成边写出, 两者同时进行, 不再分为两个阶段; 暂停时由 toggle_pause 改为 "已暂停"
+            progress.post(phase="生成并保存帧")
+            render_batch(filenames, output_dir, output_way, frame_count, glint_scale, input_scale,
+                         lambda filename, file_count, total_file, value, total:
+                         progress.post(filename=filename, files_done=file_count, total_files=total_file,
+                                       frames_done=value, total_frames=total, note=cache.progress_text()),
+                         workers, cache=cache, job=job, checkpoint=checkpoint)
+            status = "done"
+        except JobCancelled:
+            status = "cancelled"
+        finally:
+            wx.CallAfter(self.job_finished, output_dir, status)
+
+    def job_finished(self, output_dir: str, status: str):
+        self.progress_timer.Stop()
+        self.poll_progress(None)
+        self.job = None
+        self.start_process_btn.Enable()
+        self.pause_btn.Disable()
+        self.cancel_btn.Disable()
+        if status == "done":
+            progress = self.progress.snapshot()
+            self.finish_progress("无", progress.total_files, progress.total_frames, progress.note)
+            self.out_shower.load_dir(output_dir)
+            wx.MessageBox("处理完成", "处理完成", wx.ICON_INFORMATION)
+            self.clear_items()
+        elif status == "cancelled":
+            wx.MessageBox("已取消, 以相同的设置再次处理时将从中断处继续", "已取消", wx.ICON_INFORMATION)
+        else:
+            wx.MessageBox("处理出错, 详见控制台输出; 以相同的设置再次处理时将从中断处继续", "错误", wx.ICON_ERROR)
+
+    def toggle_pause(self, _):
+        if self.job.paused:
+            self.job.resume()
+            self.progress.post(phase="生成并保存帧")
+            self.pause_btn.SetLabel("暂停")
+        else:
+            self.job.pause()
+            self.progress.post(phase="已暂停")
+            self.pause_btn.SetLabel("继续")
+
+    def poll_progress(self, _):
+        progress = self.progress.poll()
+        if progress is None:
+            return
+        with profiling.stage("update_progress"):
+            self.tip_text.format(progress.filename, progress.files_done, progress.total_files, progress.phase,
+                                 progress.frames_done, progress.total_frames, progress.note)
+            if self.progress_bar_file.GetValue() != progress.files_done:
+                self.progress_bar_file.SetRange(max(1, progress.total_files))
+                self.progress_bar_file.SetValue(progress.files_done)
+            self.progress_bar_frame.SetRange(max(1, progress.total_frames))
+            self.progress_bar_frame.SetValue(progress.frames_done)
+
+    def finish_progress(self, filename: str, total_file: int, total: int, note: str = ""):
+        self.tip_text.finish(filename, total_file, total, note)
         self.progress_bar_file.SetValue(self.progress_bar_file.GetRange())
         self.progress_bar_frame.SetValue(self.progress_bar_frame.GetRange())
 
+    def add_inputs(self, paths: list[str]):
+        """文件夹 (递归) 与 zip/jar 压缩包在后台线程中展开, 边枚举边分批加入列表"""
+
+        def enumerate_inputs():
+            inputs = iter_inputs(paths)
+            while batch := list(islice(inputs, THUMBNAIL_BATCH)):
+                wx.CallAfter(self.add_files_to_list, batch)
+
+        Thread(target=enumerate_inputs, daemon=True).start()
+
     def add_files_to_list(self, filenames: list[str]):
+        """先插入占位图标的列表项, 缩略图由后台线程生成后分批填入"""
+        self.ready_assets_lc.Freeze()
         for filename in filenames:
-            if isfile(filename):
-                icon_pil = Image.open(filename)
-                icon = wx.Bitmap(64, 64)
-                icon_pil = icon_pil.resize((64, 64), resample=Image.Resampling.BOX).convert("RGBA")
-                icon.CopyFromBuffer(icon_pil.tobytes(), wx.BitmapBufferFormat_RGBA)
-                line = self.ready_assets_lc.GetItemCount()
-                self.ready_assets_lc.InsertItem(line, basename(filename), self.ready_assets_images.Add(icon))
-                self.ready_assets.append(filename)
-                self.ready_assets_icons.append(icon)
+            asset_id = self.next_asset_id
+            self.next_asset_id += 1
+            self.ready_assets[asset_id] = AssetItem(filename)
+            line = self.ready_assets_lc.InsertItem(self.ready_assets_lc.GetItemCount(), basename(filename), 0)
+            self.ready_assets_lc.SetItemData(line, asset_id)
+            self.thumbnail_loader.submit(asset_id, filename)
+        self.ready_assets_lc.Thaw()
+
+    def on_thumbnails_loaded(self, batch: list[tuple[int, bytes | None]]):
+        self.ready_assets_lc.Freeze()
+        for asset_id, data in batch:
+            item = self.ready_assets.get(asset_id)
+            if item is None:  # 缩略图生成前已被删除
+                continue
+            line = self.ready_assets_lc.FindItem(-1, asset_id)
+            if data is None:  # 不是可以读取的图片
+                self.remove_item(line)
+                continue
+            icon = wx.Bitmap.FromBufferRGBA(THUMBNAIL_SIZE, THUMBNAIL_SIZE, data)
+            if self.free_images:
+                item.image = self.free_images.pop()
+                self.ready_assets_images.Replace(item.image, icon)
+            else:
+                item.image = self.ready_assets_images.Add(icon)
+            self.ready_assets_lc.SetItemImage(line, item.image)
+        self.ready_assets_lc.Thaw()
 
     def on_ready_item_menu(self, event: wx.ListEvent):
         menu = wx.Menu()
@@ -306,58 +327,114 @@ class GUI(wx.Frame):
         self.PopupMenu(menu)
 
     def remove_item(self, index: int):
-        self.ready_assets_lc.Freeze()
-        for i in range(0, len(self.ready_assets_icons)):
-            self.ready_assets_images.Remove(i)
-        self.ready_assets.pop(index)
-        self.ready_assets_icons.pop(index)
-        self.ready_assets_lc.ClearAll()
-        for i, filename in enumerate(self.ready_assets):
-            icon = self.ready_assets_icons[i]
-            self.ready_assets_lc.InsertItem(i, basename(filename), self.ready_assets_images.Add(icon))
-        self.ready_assets_lc.Thaw()
-        self.ready_assets_lc.Refresh()
+        """只删除这一项, 它的图像列表位置留给之后的缩略图复用"""
+        item = self.ready_assets.pop(self.ready_assets_lc.GetItemData(index))
+        if item.image:
+            self.free_images.append(item.image)
+        self.ready_assets_lc.DeleteItem(index)
+
+    def clear_items(self):
+        self.ready_assets_lc.DeleteAllItems()
+        self.free_images.extend(item.image for item in self.ready_assets.values() if item.image)
+        self.ready_assets.clear()
+
+
+def format_bytes(size: int) -> str:
+    for unit in ["B", "KB", "MB"]:
+        if size < 1024:
+            return f"{size}{unit}" if unit == "B" else f"{size:.1f}{unit}"
+        size /= 1024
+    return f"{size:.1f}GB"
+
+
+output_way_labels = {
+    OutputWay.ONEFILE_GIF: "GIF",
+    OutputWay.ONEFILE_APNG: "APNG",
+    OutputWay.ONEFILE_WEBP: "WEBP",
+    OutputWay.FRAMES_PNG: "每一帧 png",
+    OutputWay.FRAMES_JPG: "每一帧 jpg",
+    OutputWay.RAW_RGBA: "raw",
+}
+
+
+class OutputListCtrl(wx.ListCtrl):
+    """虚拟列表, 只为显示出来的行生成文字, 项数再多也不会阻塞界面"""
+
+    def __init__(self, parent: wx.Window):
+        super().__init__(parent, style=wx.LC_REPORT | wx.LC_VIRTUAL | wx.LC_SINGLE_SEL)
+        for column, (label, width) in enumerate([("文件名", 150), ("类型", 70), ("帧数", 50), ("尺寸", 70),
+                                                 ("大小", 70)]):
+            self.InsertColumn(column, label, width=width)
+        self.entries: list[OutputEntry] = []
+
+    def OnGetItemText(self, item: int, column: int) -> str:
+        entry = self.entries[item]
+        if column == 0:
+            return entry.name
+        elif column == 1:
+            return output_way_labels[entry.way]
+        elif column == 2:
+            return str(entry.frame_count)
+        elif column == 3:
+            return "%dx%d" % entry.size
+        return format_bytes(entry.bytes)
 
 
 class AniPhotosViewer(wx.Panel):
     def __init__(self, parent: wx.Window):
         wx.Panel.__init__(self, parent)
         self.active_dir: str | None = None
-        self.photo_lc = wx.ListCtrl(self, style=wx.LC_REPORT)
-        self.photo_lc.InsertColumn(0, "文件名", width=150)
+        self.photo_lc = OutputListCtrl(self)
+        self.positions: dict[str, int] = {}  # 名称 -> 在列表中的位置
+        self.scanner = OutputDirScanner(lambda *update: wx.CallAfter(self.on_scanned, *update))
         self.viewer = AniPhotoShower(self)
         sizer = wx.BoxSizer(wx.HORIZONTAL)
         sizer.Add(self.photo_lc, 3, wx.EXPAND)
         sizer.Add(self.viewer, 7, wx.EXPAND)
         self.SetSizer(sizer)
         self.photo_lc.Bind(wx.EVT_LIST_ITEM_SELECTED, self.on_item_selected)
-        self.load_dir("D:\儿子文件\编程\python\PyCharm项目\MCEnchantGlint\output_test")
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.on_destroy)
 
     def load_dir(self, dir_path: str):
+        """显示 dir_path 中的输出, 扫描在后台进行, 结果陆续加入列表; 已在显示时只是立即重新扫描"""
+        if dir_path == self.active_dir:
+            self.scanner.rescan()
+            return
         self.active_dir = dir_path
-        self.photo_lc.DeleteAllItems()
-        for filename in listdir(dir_path):
-            self.photo_lc.InsertItem(self.photo_lc.GetItemCount(), filename)
+        self.photo_lc.entries = []
+        self.positions.clear()
+        self.photo_lc.SetItemCount(0)
+        self.scanner.watch(dir_path)
+
+    def on_scanned(self, dir_path: str, entries: list[OutputEntry], removed: list[str]):
+        """新出现的项追加到末尾 (已有项的位置不变), 改变的项原地更新"""
+        if not self or dir_path != self.active_dir:
+            return
+        if removed:
+            removed = set(removed)
+            self.photo_lc.entries = [entry for entry in self.photo_lc.entries if entry.name not in removed]
+            self.positions = {entry.name: index for index, entry in enumerate(self.photo_lc.entries)}
+            # 删除后其他项的位置改变, 取消选择
+            if (selected := self.photo_lc.GetFirstSelected()) != -1:
+                self.photo_lc.Select(selected, False)
+        for entry in entries:
+            index = self.positions.get(entry.name)
+            if index is None:
+                self.positions[entry.name] = len(self.photo_lc.entries)
+                self.photo_lc.entries.append(entry)
+            else:
+                self.photo_lc.entries[index] = entry
+        self.photo_lc.SetItemCount(len(self.photo_lc.entries))
+        self.photo_lc.Refresh()
 
     def on_item_selected(self, event: wx.ListEvent):
-        index = event.GetIndex()
-        file_or_dir_path = join(self.active_dir, self.photo_lc.GetItemText(index))
-        way = None
-        if isdir(file_or_dir_path):
-            if file_or_dir_path.endswith(".png"):
-                way = OutputWay.FRAMES_PNG
-            elif file_or_dir_path.endswith(".jpg"):
-                way = OutputWay.FRAMES_JPG
-        elif isfile(file_or_dir_path):
-            if file_or_dir_path.endswith(".gif"):
-                way = OutputWay.ONEFILE_GIF
-            elif file_or_dir_path.endswith(".webp"):
-                way = OutputWay.ONEFILE_WEBP
-            elif file_or_dir_path.endswith(".png"):
-                way = OutputWay.ONEFILE_APNG
-        if way is None:
-            return
-        self.viewer.load_ani_photo(self.active_dir, self.photo_lc.GetItemText(index), way)
+        entry = self.photo_lc.entries[event.GetIndex()]
+        self.viewer.load_ani_photo(self.active_dir, entry.name, entry.way)
+
+    def on_destroy(self, event: wx.WindowDestroyEvent):
+        if event.GetEventObject() is self:
+            self.scanner.close()
+        event.Skip()
 
 
 class AniPhotoShower(wx.Control):
@@ -367,70 +444,93 @@ class AniPhotoShower(wx.Control):
         self.start_play = perf_counter()
         self.frames_count = 0
         self.correct_bitmap = None
-        self.fps = 20
-        self.frames: list[Image.Image] = []
+        self.fps = FPS
+        self.decoder: PreviewDecoder | None = None
+        self.store: RawFrameStore | None = None  # 原始帧存储直接从映射内存创建位图, 不需要解码
+        self.bitmaps = LRUCache(1)
         self.upt_call = None
         self.Bind(wx.EVT_PAINT, self.on_paint)
         self.Bind(wx.EVT_SIZING, self.on_size)
+        self.Bind(wx.EVT_WINDOW_DESTROY, self.on_destroy)
         self.SetDoubleBuffered(True)
 
     def load_ani_photo(self, dir_path: str, filename: str, output_way: OutputWay):
         if self.upt_call:
             self.upt_call.Stop()
-        self.frames.clear()
-        if output_way in [OutputWay.ONEFILE_GIF, OutputWay.ONEFILE_WEBP, OutputWay.ONEFILE_APNG]:
-            image = Image.open(join(dir_path, filename))
-            for i in range(getattr(image, "n_frames")):
-                image.seek(i)
-                self.frames.append(image.copy())
-        elif output_way in [OutputWay.FRAMES_PNG, OutputWay.FRAMES_JPG]:
-            filename2 = ""
-            for filename2 in listdir(join(dir_path, filename)):
-                break
-            index = 0
-            start, end = filename2[0: filename2.rindex("_") + 1], filename2[filename2.rindex("."):]
-            while True:
-                photo_fp = join(dir_path, filename, start + str(index) + end)
-                if isfile(photo_fp):
-                    image = Image.open(photo_fp)
-                    self.frames.append(image)
-                    index += 1
-                else:
-                    break
+        self.close_source()
+        self.correct_bitmap = None
+        if output_way == OutputWay.RAW_RGBA:
+            self.store = RawFrameStore(join(dir_path, filename))
+            self.frames_count = self.store.count
+            self.fps = self.store.fps or FPS
+            width, height = self.store.size
+        else:
+            source = open_frame_source(join(dir_path, filename), output_way)
+            self.frames_count = source.count
+            self.fps = FPS
+            width, height = source.size
+            if self.frames_count:
+                # 只解码第一帧就开始播放, 之后的帧由后台线程提前解码
+                self.decoder = PreviewDecoder(source)
+            else:
+                source.close()
+        if self.frames_count == 0:
+            self.close_source()
+            self.Refresh()
+            return
+        self.bitmaps = LRUCache(PREVIEW_BITMAP_CACHE // max(1, width * height * 4))
         self.start_play = perf_counter()
         self.correct_frame_index = 0
-        self.frames_count = len(self.frames)
         self.upt_call = wx.CallAfter(self.update_photo)
 
     def update_photo(self):
         during = perf_counter() - self.start_play
         now_frame_index = int(during / (1 / self.fps))
         try:
-            if now_frame_index >= len(self.frames):
-                self.correct_frame_index = 0
+            if now_frame_index >= self.frames_count:
+                now_frame_index = 0
                 self.start_play = perf_counter()
-                self.load_bitmap()
-                self.Refresh()
-            elif now_frame_index != self.correct_frame_index:
-                self.correct_frame_index = now_frame_index
-                self.load_bitmap()
-                self.Refresh()
+            if now_frame_index != self.correct_frame_index or self.correct_bitmap is None:
+                if self.load_bitmap(now_frame_index):
+                    self.correct_frame_index = now_frame_index
+                    self.Refresh()
+                else:
+                    # 这一帧还没有解码好, 暂停计时, 稍后重试
+                    self.start_play = perf_counter() - self.correct_frame_index / self.fps
+                    self.upt_call = wx.CallLater(5, self.update_photo)
+                    return
             self.upt_call = wx.CallLater(int(1000 / self.fps), self.update_photo)
         except RuntimeError:
             pass
 
-    def load_bitmap(self):
-        image: Image.Image = self.frames[self.correct_frame_index]
-        wx_image = wx.Image(image.width, image.height)
-        wx_image.SetData(image.convert("RGB").tobytes())
-        try:
-            wx_image.SetAlpha(image.getchannel("A").tobytes())
-        except ValueError:
-            pass
-
-        if self.correct_bitmap:
-            self.correct_bitmap.Destroy()
-        self.correct_bitmap = wx_image.ConvertToBitmap()
+    def close_source(self):
+        if self.decoder:
+            self.decoder.close()
+            self.decoder = None
+        if self.store:
+            self.store.close()
+            self.store = None
+
+    def load_bitmap(self, index: int) -> bool:
+        """把第 index 帧设为当前位图, 该帧尚未解码好时返回 False"""
+        if self.store is not None:
+            self.correct_bitmap = self.bitmaps.get(index)
+            if self.correct_bitmap is None:
+                self.correct_bitmap = wx.Bitmap.FromBufferRGBA(*self.store.size, self.store.frame(index))
+                self.bitmaps.put(index, self.correct_bitmap)
+            return True
+        frame = self.decoder.get(index)
+        bitmap = self.bitmaps.get(index)
+        if bitmap is None:
+            if frame is None:
+                return False
+            wx_image = wx.Image(*frame.size, frame.rgb)
+            if frame.alpha is not None:
+                wx_image.SetAlpha(frame.alpha)
+            bitmap = wx_image.ConvertToBitmap()
+            self.bitmaps.put(index, bitmap)
+        self.correct_bitmap = bitmap
+        return True
 
     def on_paint(self, _):
         dc = wx.PaintDC(self)
@@ -449,16 +549,19 @@ class AniPhotoShower(wx.Control):
         self.Refresh()
         event.Skip()
 
-
-def test():
-    glint = load_glint(4)
-    frames = process_an_file(r"D:\Desktop\textures\item\acacia_boat.png", glint, 1650, 1, lambda x: None)
-    print("Writing frames...")
-    frames[0].save("acacia_boat.webp", "WEBP", save_all=True, append_images=frames, duration=1000 / 20, loop=0)
+    def on_destroy(self, event: wx.WindowDestroyEvent):
+        self.close_source()
+        event.Skip()
 
 
 if __name__ == "__main__":
+    # 设置环境变量 GLINT_PROFILE_REPORT=报告路径 (.json 或 .csv) 时开启性能统计, 退出时写出报告
+    profile_report = environ.get("GLINT_PROFILE_REPORT")
+    if profile_report:
+        profiling.enable()
     app = wx.App()
     control_panel = GUI(None)
     control_panel.Show()
     app.MainLoop()
+    if profile_report:
+        profiling.write_report(profile_report)
@@ -0,0 +1,723 @@
+"""
+output.py
+输出方式与逐帧写入器
+所有写入器都逐帧接收图像, 写完即丢弃, 内存占用与总帧数无关
+"""
+import json
+import os
+import struct
+import zlib
+from collections import deque
+from dataclasses import dataclass
+from enum import Enum
+from io import BytesIO
+from os import mkdir, makedirs
+from os.path import basename, join, exists, isdir, isfile
+from queue import Queue, Full, Empty
+from threading import Thread, Event
+from time import perf_counter
+from typing import Callable, Iterable, Iterator, BinaryIO, TYPE_CHECKING
+
+import numpy as np
+from PIL import Image, GifImagePlugin
+
+import profiling
+
+if TYPE_CHECKING:
+    from concurrent.futures import Future
+
+FPS = 20
+FRAME_DURATION = 1000 / FPS
+MAX_IN_FLIGHT_FRAMES = 16  # 生成与写入之间最多缓冲的帧数
+GIF_PALETTE_FRAMES = 8  # GIF 用前几帧生成整个动图共用的调色板
+GIF_TRANSPARENT_INDEX = 255
+RESOURCE_PACK_NAME = "enchanted_glint_pack"
+RESOURCE_PACK_FORMAT = 34  # 1.21
+RESOURCE_PACK_TEXTURE_DIR = join("assets", "minecraft", "textures", "item")
+SAVE_THREADS = min(8, os.cpu_count() or 1)  # 逐帧输出时并行编码的线程数
+
+
+class OutputWay(Enum):
+    ONEFILE_GIF = 0
+    ONEFILE_APNG = 1
+    ONEFILE_WEBP = 2
+    FRAMES_PNG = 3
+    FRAMES_JPG = 4
+    RESOURCE_PACK = 5
+    RAW_RGBA = 6  # 原始帧存储, 见 framestore.py
+
+
+end_fix_trans_map = {
+    OutputWay.ONEFILE_GIF: "gif",
+    OutputWay.ONEFILE_APNG: "png",
+    OutputWay.ONEFILE_WEBP: "webp",
+    OutputWay.FRAMES_PNG: "png",
+    OutputWay.FRAMES_JPG: "jpg",
+    OutputWay.RESOURCE_PACK: "png",
+    OutputWay.RAW_RGBA: "raw",
+}
+
+
+OutputWays = OutputWay | list[OutputWay]  # 一种输出方式, 或同时输出的多种 (见 FanOutWriter)
+
+
+def as_ways(output_way: OutputWays) -> list[OutputWay]:
+    return [output_way] if isinstance(output_way, OutputWay) else list(output_way)
+
+
+def is_frames_output(output_way: OutputWays) -> bool:
+    """是否只输出每一帧 (此时可按帧范围拆分任务, 检查点记录已保存的帧)"""
+    ways = as_ways(output_way)
+    return len(ways) == 1 and ways[0] in [OutputWay.FRAMES_PNG, OutputWay.FRAMES_JPG]
+
+
+def frames_for_output(output_way: OutputWays, frame_count: int, period: int) -> int:
+    """
+    实际需要生成的帧数, 资源包中的动画由游戏循环播放, 只需要一个循环周期;
+    同时输出多种格式时取其中最多的 (资源包只写入前一个周期, 其他格式只写入前 frame_count 帧, 见 open_writer)
+    """
+    return max(period if way == OutputWay.RESOURCE_PACK else frame_count for way in as_ways(output_way))
+
+
+@dataclass
+class EncoderSettings:
+    png_compress_level: int = 6  # 0-9
+    jpg_quality: int = 75  # 1-95
+    jpg_subsampling: str = "4:2:0"  # 4:4:4, 4:2:2, 4:2:0
+    webp_lossless: bool = False
+    webp_quality: int = 80  # 0-100, 无损时表示压缩力度
+    webp_method: int = 0  # 0-6, 越大越慢, 文件越小
+
+    def save_params(self, end_fix: str) -> dict:
+        if end_fix == "jpg":
+            return {"quality": self.jpg_quality, "subsampling": self.jpg_subsampling}
+        elif end_fix == "webp":
+            return {"lossless": self.webp_lossless, "quality": self.webp_quality, "method": self.webp_method}
+        return {"compress_level": self.png_compress_level}
+
+
+class FrameWriter:
+    """逐帧写入器的基类, written 为已按顺序完整写入的帧数"""
+    written = 0
+
+    def write(self, frame: Image.Image):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+    def abort(self):
+        """出错或取消时代替 close, 不留下不完整的输出"""
+        self.close()
+
+    def outputs(self) -> list[str]:
+        """写入器产生的文件或文件夹"""
+        return []
+
+
+class FileWriter(FrameWriter):
+    """
+    写入单个动图文件的写入器, 关闭时同时关闭文件
+    先写入临时文件, 关闭时再替换目标文件, 不会改动目标文件原有的内容 (它可能是渲染缓存的硬链接)
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self.temp_path = f"{path}.{os.getpid()}.{id(self)}.tmp"
+        self.fp: BinaryIO = open(self.temp_path, "wb")
+
+    def close(self):
+        self.fp.close()
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        self.fp.close()
+        os.remove(self.temp_path)
+
+    def outputs(self) -> list[str]:
+        return [self.path]
+
+
+def output_size(path: str) -> int:
+    """输出文件的大小; 逐帧输出的文件夹为其中所有文件的大小之和"""
+    if isdir(path):
+        return sum(entry.stat().st_size for entry in os.scandir(path) if entry.is_file())
+    return os.path.getsize(path)
+
+
+def new_frames_dir(filename: str, output_dir: str, reserved: Iterable[str] = ()) -> str:
+    """
+    为逐帧输出创建文件夹, 同名的文件或文件夹已存在时在名称后追加序号
+    reserved 为同时输出的其他文件的路径 (可能还未写出), 同样视为已存在
+    """
+    reserved = set(reserved)
+
+    def taken(path: str) -> bool:
+        return exists(path) or path in reserved
+
+    if taken(join(output_dir, filename)):
+        counter = 1
+        while taken(join(output_dir, filename + f" ({counter})")):
+            counter += 1
+        dir_name = join(output_dir, filename + f" ({counter})")
+    else:
+        dir_name = join(output_dir, filename)
+    mkdir(dir_name)
+    return dir_name
+
+
+class FramesDirWriter(FrameWriter):
+    """
+    把每一帧保存为文件夹中的单独文件, 文件序号从 first_index 开始
+    编码在线程池中进行 (PIL 编码时会释放 GIL), 最多 max_pending 帧同时等待保存
+    """
+
+    def __init__(self, filename: str, dir_name: str, output_way: OutputWay, first_index: int = 0,
+                 settings: EncoderSettings | None = None, threads: int = SAVE_THREADS,
+                 max_pending: int = MAX_IN_FLIGHT_FRAMES):
+        self.end_fix: str = end_fix_trans_map[output_way]
+        self.format = "JPEG" if self.end_fix == "jpg" else "PNG"
+        self.params = (settings or EncoderSettings()).save_params(self.end_fix)
+        self.name = basename(filename).split(".")[0]
+        self.dir_name = dir_name
+        self.index = first_index
+        from concurrent.futures import ThreadPoolExecutor  # 导入时间较长, 只在逐帧输出时导入
+
+        self.executor = ThreadPoolExecutor(threads)
+        self.pending: "deque[Future]" = deque()
+        self.max_pending = max(1, max_pending)
+
+    def save(self, frame: Image.Image, index: int):
+        with profiling.stage("save_frame"):
+            if self.format == "JPEG":
+                frame = frame.convert("RGB")
+            frame.save(join(self.dir_name, f"{self.name}_{index}.{self.end_fix}"), self.format, **self.params)
+
+    def collect(self, block: bool):
+        """按顺序取出已完成的保存任务, block 为真时至少等待最早的一个"""
+        while self.pending and (block or self.pending[0].done()):
+            self.pending.popleft().result()
+            self.written += 1
+            block = False
+
+    def write(self, frame: Image.Image):
+        self.pending.append(self.executor.submit(self.save, frame, self.index))
+        self.index += 1
+        self.collect(len(self.pending) >= self.max_pending)
+
+    def close(self):
+        try:
+            while self.pending:
+                self.collect(True)
+        finally:
+            self.executor.shutdown(cancel_futures=True)
+
+    def abort(self):
+        """已保存的帧都是完整的文件, 保留下来 (检查点据此只补齐缺少的帧)"""
+        self.executor.shutdown(cancel_futures=True)
+
+    def outputs(self) -> list[str]:
+        return [self.dir_name]
+
+
+def changed_bbox(previous: np.ndarray | None, current: np.ndarray) -> tuple[int, int, int, int]:
+    """当前帧与上一帧不同的区域 (x0, y0, x1, y1); 没有上一帧时为整帧, 完全相同时为左上角 1x1"""
+    height, width = current.shape[:2]
+    if previous is None:
+        return 0, 0, width, height
+    diff = previous != current
+    if diff.ndim == 3:
+        diff = diff.any(axis=2)
+    rows = np.flatnonzero(diff.any(axis=1))
+    if len(rows) == 0:
+        return 0, 0, 1, 1
+    cols = np.flatnonzero(diff.any(axis=0))
+    return int(cols[0]), int(rows[0]), int(cols[-1]) + 1, int(rows[-1]) + 1
+
+
+def build_gif_palette(frames: list[Image.Image]) -> Image.Image:
+    """
+    用若干帧中不透明的像素生成 255 色调色板, 第 256 色留作透明色
+    透明色与第一种颜色相同, 量化时不会被单独选中
+    """
+    pixels = np.concatenate([np.asarray(frame)[..., :3][np.asarray(frame)[..., 3] > 0] for frame in frames])
+    if len(pixels) == 0:
+        pixels = np.zeros((1, 3), np.uint8)
+    quantized = Image.fromarray(pixels.reshape(-1, 1, 3)).quantize(GIF_TRANSPARENT_INDEX)
+    colors = quantized.getpalette()[:GIF_TRANSPARENT_INDEX * 3]
+    colors += colors[:3] * (256 - len(colors) // 3)
+    palette = Image.new("P", (1, 1))
+    palette.putpalette(colors)
+    return palette
+
+
+class GifWriter(FileWriter):
+    """
+    逐帧写入GIF, 整个动图共用一个全局调色板, 每帧只写入与上一帧不同的矩形区域
+    区域内未变化的像素写为透明色, 上一帧不清除 (disposal 1) 以便透出
+    输入帧中完全透明的像素在各帧中位置不变, 因此不会透出旧内容
+    """
+
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.palette: Image.Image | None = None
+        self.sample_frames: list[Image.Image] = []
+        self.previous: np.ndarray | None = None
+
+    def write(self, frame: Image.Image):
+        if self.palette is None:
+            self.sample_frames.append(frame)
+            if len(self.sample_frames) >= GIF_PALETTE_FRAMES:
+                self.flush_samples()
+            return
+        self.write_frame(frame)
+
+    def flush_samples(self):
+        self.palette = build_gif_palette(self.sample_frames)
+        for frame in self.sample_frames:
+            self.write_frame(frame)
+        self.sample_frames.clear()
+
+    def write_frame(self, frame: Image.Image):
+        indexes = np.array(frame.convert("RGB").quantize(palette=self.palette, dither=Image.Dither.NONE))
+        indexes[np.asarray(frame)[..., 3] == 0] = GIF_TRANSPARENT_INDEX
+        x0, y0, x1, y1 = changed_bbox(self.previous, indexes)
+        region = indexes[y0:y1, x0:x1]
+        if self.previous is not None:
+            region = np.where(region == self.previous[y0:y1, x0:x1], GIF_TRANSPARENT_INDEX, region)
+        self.previous = indexes
+        im = Image.frombytes("P", (x1 - x0, y1 - y0), region.astype(np.uint8).tobytes())
+        im.putpalette(self.palette.getpalette())
+        if self.written == 0:
+            header, _ = GifImagePlugin.getheader(im, info={"loop": 0, "duration": FRAME_DURATION})
+            self.fp.write(b"".join(header))
+        self.fp.write(b"".join(GifImagePlugin.getdata(im, (x0, y0), duration=FRAME_DURATION, disposal=1,
+                                                      transparency=GIF_TRANSPARENT_INDEX)))
+        self.written += 1
+
+    def close(self):
+        if self.sample_frames:
+            self.flush_samples()
+        if self.written:
+            self.fp.write(b";")
+        super().close()
+
+
+def iter_chunks(data: bytes, start: int) -> Iterator[tuple[bytes, bytes]]:
+    """遍历 PNG 风格 (大端长度) 的数据块, 返回 (类型, 内容)"""
+    while start < len(data):
+        length, = struct.unpack(">I", data[start:start + 4])
+        yield data[start + 4:start + 8], data[start + 8:start + 8 + length]
+        start += 12 + length
+
+
+def png_chunk(chunk_type: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I", len(payload)) + chunk_type + payload + \
+        struct.pack(">I", zlib.crc32(chunk_type + payload) & 0xFFFFFFFF)
+
+
+class ApngWriter(FileWriter):
+    """
+    逐帧写入APNG, 每帧只编码与上一帧不同的矩形区域 (直接覆盖, 不混合),
+    单独编码为PNG后把 IDAT 改写为 fdAT
+    """
+
+    def __init__(self, path: str, **encoder_params):
+        super().__init__(path)
+        self.encoder_params = encoder_params
+        self.sequence = 0
+        self.actl_pos = 0
+        self.previous: np.ndarray | None = None
+
+    def write(self, frame: Image.Image):
+        pixels = np.asarray(frame)
+        x0, y0, x1, y1 = changed_bbox(self.previous, pixels)
+        self.previous = pixels
+        buf = BytesIO()
+        frame.crop((x0, y0, x1, y1)).save(buf, "PNG", **self.encoder_params)
+        chunks = list(iter_chunks(buf.getvalue(), 8))
+        if self.written == 0:
+            self.fp.write(b"\x89PNG\r\n\x1a\n")
+            self.fp.write(png_chunk(b"IHDR", chunks[0][1]))
+            self.actl_pos = self.fp.tell()
+            self.fp.write(png_chunk(b"acTL", struct.pack(">II", 0, 0)))
+        self.fp.write(png_chunk(b"fcTL", struct.pack(">IIIIIHHBB", self.sequence, x1 - x0, y1 - y0, x0, y0,
+                                                     1, FPS, 0, 0)))
+        self.sequence += 1
+        for chunk_type, payload in chunks:
+            if chunk_type != b"IDAT":
+                continue
+            if self.written == 0:
+                self.fp.write(png_chunk(b"IDAT", payload))
+            else:
+                self.fp.write(png_chunk(b"fdAT", struct.pack(">I", self.sequence) + payload))
+                self.sequence += 1
+        self.written += 1
+
+    def close(self):
+        if self.written:
+            self.fp.write(png_chunk(b"IEND", b""))
+            self.fp.seek(self.actl_pos)
+            self.fp.write(png_chunk(b"acTL", struct.pack(">II", self.written, 0)))
+        super().close()
+
+
+def riff_chunk(chunk_type: bytes, payload: bytes) -> bytes:
+    return chunk_type + struct.pack("<I", len(payload)) + payload + b"\0" * (len(payload) % 2)
+
+
+def uint24(value: int) -> bytes:
+    return struct.pack("<I", value)[:3]
+
+
+class WebPWriter(FileWriter):
+    """
+    逐帧写入WebP动图, 每帧只编码与上一帧不同的矩形区域 (直接覆盖, 不混合),
+    单独编码后封装为 ANMF 块
+    """
+
+    def __init__(self, path: str, **encoder_params):
+        super().__init__(path)
+        self.encoder_params = encoder_params
+        self.previous: np.ndarray | None = None
+
+    def write(self, frame: Image.Image):
+        if self.written == 0:
+            self.fp.write(b"RIFF\0\0\0\0WEBP")
+            self.fp.write(riff_chunk(b"VP8X", bytes([0x12, 0, 0, 0]) + uint24(frame.width - 1) +
+                                     uint24(frame.height - 1)))
+            self.fp.write(riff_chunk(b"ANIM", bytes(4) + struct.pack("<H", 0)))
+        pixels = np.asarray(frame)
+        x0, y0, x1, y1 = changed_bbox(self.previous, pixels)
+        self.previous = pixels
+        # ANMF 中的偏移只能是偶数
+        x0, y0 = x0 - x0 % 2, y0 - y0 % 2
+        buf = BytesIO()
+        frame.crop((x0, y0, x1, y1)).save(buf, "WEBP", **self.encoder_params)
+        data = buf.getvalue()
+        frame_data = b""
+        pos = 12
+        while pos < len(data):
+            chunk_type = data[pos:pos + 4]
+            length, = struct.unpack("<I", data[pos + 4:pos + 8])
+            if chunk_type in (b"ALPH", b"VP8 ", b"VP8L"):
+                frame_data += data[pos:pos + 8 + length + length % 2]
+            pos += 8 + length + length % 2
+        self.fp.write(riff_chunk(b"ANMF", uint24(x0 // 2) + uint24(y0 // 2) + uint24(x1 - x0 - 1) +
+                                 uint24(y1 - y0 - 1) + uint24(int(FRAME_DURATION)) + bytes([0b10]) + frame_data))
+        self.written += 1
+
+    def close(self):
+        if self.written:
+            end = self.fp.tell()
+            self.fp.seek(4)
+            self.fp.write(struct.pack("<I", end - 8))
+        super().close()
+
+
+class ResourcePackWriter(FileWriter):
+    """
+    把所有帧竖向拼接为一张PNG材质, 并生成 .mcmeta 动画描述, 放在资源包的物品材质目录中
+    拼接图按行流式压缩写入, 总高度在关闭时回填到 IHDR
+    给出 max_frames (光效的循环周期) 时之后的帧被忽略, 以便与需要更多帧的格式一起输出
+    """
+
+    def __init__(self, filename: str, output_dir: str, compress_level: int = 6, max_frames: int | None = None):
+        pack_dir = join(output_dir, RESOURCE_PACK_NAME)
+        texture_dir = join(pack_dir, RESOURCE_PACK_TEXTURE_DIR)
+        makedirs(texture_dir, exist_ok=True)
+        if not isfile(join(pack_dir, "pack.mcmeta")):
+            with open(join(pack_dir, "pack.mcmeta"), "w", encoding="utf-8") as f:
+                json.dump({"pack": {"pack_format": RESOURCE_PACK_FORMAT, "description": "Enchanted glint"}}, f,
+                          indent=2)
+        super().__init__(join(texture_dir, basename(filename).split(".")[0] + ".png"))
+        self.compressor = zlib.compressobj(compress_level)
+        self.max_frames = max_frames
+        self.width = 0
+        self.height = 0
+
+    def write(self, frame: Image.Image):
+        if self.max_frames is not None and self.written >= self.max_frames:
+            return
+        pixels = np.asarray(frame.convert("RGBA"))
+        if self.written == 0:
+            self.width, self.height = frame.size
+            self.fp.write(b"\x89PNG\r\n\x1a\n")
+            self.fp.write(self.ihdr())
+        # 每行使用 Sub 过滤: 与左侧像素做差
+        filtered = pixels.copy()
+        filtered[:, 1:] -= pixels[:, :-1]
+        rows = np.empty((self.height, self.width * 4 + 1), np.uint8)
+        rows[:, 0] = 1
+        rows[:, 1:] = filtered.reshape(self.height, -1)
+        data = self.compressor.compress(rows.tobytes())
+        if data:
+            self.fp.write(png_chunk(b"IDAT", data))
+        self.written += 1
+
+    def ihdr(self) -> bytes:
+        return png_chunk(b"IHDR", struct.pack(">IIBBBBB", self.width, self.height * max(1, self.written), 8, 6, 0, 0,
+                                              0))
+
+    def close(self):
+        if self.written:
+            self.fp.write(png_chunk(b"IDAT", self.compressor.flush()))
+            self.fp.write(png_chunk(b"IEND", b""))
+            self.fp.seek(8)
+            self.fp.write(self.ihdr())
+            animation = {"frametime": 1}
+            if self.width != self.height:  # 未指定时游戏把帧视为正方形 (边长为材质宽度)
+                animation.update(width=self.width, height=self.height)
+            with open(self.path + ".mcmeta", "w", encoding="utf-8") as f:
+                json.dump({"animation": animation}, f, indent=2)
+        super().close()
+
+    def outputs(self) -> list[str]:
+        return [self.path, self.path + ".mcmeta"]
+
+
+class FanOutWriter(FrameWriter):
+    """
+    把同一帧交给多个写入器, 每个写入器在自己的线程中编码, 总耗时接近最慢的一个而不是各格式之和
+    各线程的队列中放的是同一批帧对象, 最快的写入器最多领先最慢的 max_in_flight 帧, 内存不随格式数成倍增加
+    max_frames 给出每个写入器最多写入的帧数 (None 为不限), 为资源包生成的一个周期多于其他格式要求的帧数时使用
+    written 为所有写入器都已处理的帧数 (资源包只写入一个周期, 超出 max_frames 的帧也算已处理)
+    """
+
+    def __init__(self, writers: list[FrameWriter], max_in_flight: int = MAX_IN_FLIGHT_FRAMES,
+                 max_frames: list[int | None] | None = None):
+        self.writers = writers
+        self.max_frames = max_frames or [None] * len(writers)
+        self.queues: list[Queue] = [Queue(max(1, max_in_flight)) for _ in writers]
+        self.handled = [0] * len(writers)
+        self.closed = [False] * len(writers)
+        self.error: BaseException | None = None
+        self.stop = Event()
+        self.threads = [Thread(target=self.run, args=(index,), daemon=True) for index in range(len(writers))]
+        for thread in self.threads:
+            thread.start()
+
+    @property
+    def written(self) -> int:
+        return min(self.handled)
+
+    def run(self, index: int):
+        writer, queue, max_frames = self.writers[index], self.queues[index], self.max_frames[index]
+        stage = "encode_" + type(writer).__name__
+        try:
+            while not self.stop.is_set():
+                try:
+                    frame = queue.get(timeout=0.1)
+                except Empty:
+                    continue
+                if frame is None:
+                    with profiling.stage(stage):
+                        writer.close()
+                    self.closed[index] = True
+                    return
+                if max_frames is None or self.handled[index] < max_frames:
+                    with profiling.stage(stage):
+                        writer.write(frame)
+                self.handled[index] += 1
+        except BaseException as e:
+            if self.error is None:
+                self.error = e
+            self.stop.set()
+
+    def put(self, item: Image.Image | None):
+        for queue in self.queues:
+            while True:
+                if self.error is not None:
+                    raise self.error
+                try:
+                    queue.put(item, timeout=0.1)
+                    break
+                except Full:
+                    pass
+
+    def write(self, frame: Image.Image):
+        self.put(frame)
+
+    def close(self):
+        try:
+            self.put(None)
+            for thread in self.threads:
+                thread.join()
+            if self.error is not None:
+                raise self.error
+        except BaseException:
+            self.abort()
+            raise
+
+    def abort(self):
+        self.stop.set()
+        for thread in self.threads:
+            thread.join()
+        for index, writer in enumerate(self.writers):
+            if not self.closed[index]:
+                self.closed[index] = True
+                writer.abort()
+
+    def outputs(self) -> list[str]:
+        return [path for writer in self.writers for path in writer.outputs()]
+
+
+def open_writer(filename: str, output_dir: str, output_way: OutputWays, settings: EncoderSettings | None = None,
+                period: int | None = None, frame_count: int | None = None) -> FrameWriter:
+    """
+    output_way 为多种输出方式时返回 FanOutWriter; period 为光效的循环周期, 资源包只写入这么多帧,
+    frame_count 为要求的帧数, 为资源包生成的帧 (见 frames_for_output) 更多时其他格式只写入这么多帧
+    """
+    settings = settings or EncoderSettings()
+    ways = as_ways(output_way)
+    if len(ways) != 1:
+        if not ways:
+            raise ValueError("No output way")
+        # 先打开写出单个文件的写入器, 逐帧输出的文件夹避开它们的路径 (APNG 动图与文件夹都以输入的文件名命名)
+        frames_ways = [way for way in ways if way in [OutputWay.FRAMES_PNG, OutputWay.FRAMES_JPG]]
+        writers = [open_writer(filename, output_dir, way, settings, period) for way in ways if way not in frames_ways]
+        reserved = [path for writer in writers for path in writer.outputs()]
+        for way in frames_ways:
+            dir_name = new_frames_dir(filename, output_dir, reserved)
+            writers.append(FramesDirWriter(filename, dir_name, way, settings=settings))
+        return FanOutWriter(writers, max_frames=[None if isinstance(writer, ResourcePackWriter) else frame_count
+                                                 for writer in writers])
+    output_way = ways[0]
+    if output_way in [OutputWay.FRAMES_PNG, OutputWay.FRAMES_JPG]:
+        return FramesDirWriter(filename, new_frames_dir(filename, output_dir), output_way, settings=settings)
+    elif output_way == OutputWay.RESOURCE_PACK:
+        return ResourcePackWriter(filename, output_dir, settings.png_compress_level, period)
+    if output_way not in [OutputWay.ONEFILE_GIF, OutputWay.ONEFILE_APNG, OutputWay.ONEFILE_WEBP, OutputWay.RAW_RGBA]:
+        raise ValueError("Invalid output way")
+    end_fix = end_fix_trans_map[output_way]
+    path = join(output_dir, basename(filename).split(".")[0] + "." + end_fix)
+    if output_way == OutputWay.RAW_RGBA:
+        from framestore import RawFrameWriter
+
+        return RawFrameWriter(path)
+    params = settings.save_params(end_fix)
+    if output_way == OutputWay.ONEFILE_GIF:
+        return GifWriter(path)
+    elif output_way == OutputWay.ONEFILE_APNG:
+        return ApngWriter(path, **params)
+    return WebPWriter(path, **params)
+
+
+def buffered(frames: Iterable[Image.Image], max_in_flight: int = MAX_IN_FLIGHT_FRAMES) -> Iterator[Image.Image]:
+    """在后台线程中提前生成帧, 最多缓冲 max_in_flight 帧, 使生成与编码并行"""
+    queue: Queue = Queue(max_in_flight)
+    stop = Event()
+    end = object()
+
+    def put(item) -> bool:
+        while not stop.is_set():
+            try:
+                queue.put(item, timeout=0.1)
+                return True
+            except Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for frame in frames:
+                if not put((frame, None)):
+                    return
+            put((end, None))
+        except Exception as e:
+            put((end, e))
+
+    Thread(target=produce, daemon=True).start()
+    try:
+        while True:
+            frame, error = queue.get()
+            if frame is end:
+                if error is not None:
+                    raise error
+                return
+            yield frame
+    finally:
+        stop.set()
+
+
+def write_frames(writer: FrameWriter, frames: Iterable[Image.Image], cbk: Callable[[int], None]):
+    """把 frames 逐帧交给 writer 并关闭, cbk 的参数为已按顺序写完的帧数; 出错或取消时放弃写入"""
+    try:
+        for frame in frames:
+            written = writer.written
+            with profiling.stage("encode"):
+                writer.write(frame)
+            if writer.written != written:
+                with profiling.stage("progress_callback"):
+                    cbk(writer.written)
+    except BaseException:
+        writer.abort()
+        raise
+    written = writer.written
+    try:
+        with profiling.stage("encode"):
+            writer.close()
+    except BaseException:  # 如目标路径被同名文件夹占用, 不留下临时文件
+        writer.abort()
+        raise
+    if writer.written != written:
+        cbk(writer.written)
+
+
+def record_outputs(filename: str, writer: FrameWriter, start: float):
+    """开启性能统计时, 记录一个文件的帧数、耗时与写入字节数"""
+    if profiling.enabled:
+        profiling.record_file(filename, writer.written, perf_counter() - start,
+                              sum(map(output_size, writer.outputs())))
+
+
+def output_frames(filename: str, output_dir: str, frames: Iterable[Image.Image], output_way: OutputWays,
+                  cbk: Callable[[int], None], settings: EncoderSettings | None = None,
+                  period: int | None = None, frame_count: int | None = None) -> list[str]:
+    """逐帧消费 frames 并写出, frames 可以是生成器; 返回写出的文件或文件夹"""
+    start = perf_counter()
+    writer = open_writer(filename, output_dir, output_way, settings, period, frame_count)
+    write_frames(writer, frames, cbk)
+    record_outputs(filename, writer, start)
+    return writer.outputs()
+
+
+def output_stacked_frames(filenames: list[str], output_dir: str, frames: Iterable[list[Image.Image]],
+                          output_way: OutputWays, cbk: Callable[[int], None],
+                          settings: EncoderSettings | None = None, period: int | None = None,
+                          frame_count: int | None = None) -> list[list[str]]:
+    """
+    同 output_frames, 但 frames 每次给出各输入图的同一帧 (见 compositor.process_files), 分别写入各自的文件
+    cbk 的参数为所有文件已写完的帧数之和; 返回各输入图写出的文件或文件夹
+    """
+    start = perf_counter()
+    writers = [open_writer(filename, output_dir, output_way, settings, period, frame_count) for filename in filenames]
+    try:
+        for frame_list in frames:
+            written = sum(writer.written for writer in writers)
+            with profiling.stage("encode"):
+                for writer, frame in zip(writers, frame_list):
+                    writer.write(frame)
+            if sum(writer.written for writer in writers) != written:
+                with profiling.stage("progress_callback"):
+                    cbk(sum(writer.written for writer in writers))
+    except BaseException:
+        for writer in writers:
+            writer.abort()
+        raise
+    written = sum(writer.written for writer in writers)
+    closed = 0
+    try:
+        with profiling.stage("encode"):
+            for writer in writers:
+                writer.close()
+                closed += 1
+    except BaseException:
+        for writer in writers[closed:]:
+            writer.abort()
+        raise
+    if sum(writer.written for writer in writers) != written:
+        cbk(sum(writer.written for writer in writers))
+    for filename, writer in zip(filenames, writers):
+        record_outputs(filename, writer, start)
+    return [writer.outputs() for writer in writers]
@@ -0,0 +1,136 @@
+"""
+output_browser.py
+浏览输出文件夹: 后台线程扫描, 缓存每一项的元数据 (输出方式, 帧数, 尺寸, 大小), 不导入 wx
+每次扫描只用 os.scandir 列一次目录, 修改时间与大小都未改变的项直接使用缓存, 只读取新出现或改变的项;
+变化分批交给界面, 界面只需增量更新列表
+"""
+import os
+import re
+from dataclasses import dataclass
+from os.path import join
+from threading import Thread, Event
+from typing import Callable
+
+from framestore import RawFrameStore
+from output import OutputWay, output_size
+from preview import open_frame_source
+
+OUTPUT_SCAN_INTERVAL = 1.0  # 两次扫描的间隔 (秒), 处理中新写出的输出随之出现
+OUTPUT_SCAN_BATCH = 64  # 每读取这么多项的元数据交付一次
+
+file_ways = {"gif": OutputWay.ONEFILE_GIF, "png": OutputWay.ONEFILE_APNG, "webp": OutputWay.ONEFILE_WEBP,
+             "raw": OutputWay.RAW_RGBA}
+dir_ways = {"png": OutputWay.FRAMES_PNG, "jpg": OutputWay.FRAMES_JPG}
+
+
+@dataclass
+class OutputEntry:
+    name: str
+    way: OutputWay
+    frame_count: int = 0
+    size: tuple[int, int] = (0, 0)  # 每帧的宽高
+    bytes: int = 0  # 逐帧输出为文件夹中所有帧之和
+
+
+def output_way_of(name: str, is_dir: bool) -> OutputWay | None:
+    """按名称判断输出方式, 无法预览的项 (临时文件、资源包等) 为 None"""
+    name = re.sub(r" \(\d+\)$", "", name) if is_dir else name  # 同名文件夹追加的序号, 见 output.new_frames_dir
+    end_fix = name.rsplit(".", 1)[-1].lower() if "." in name else ""
+    return (dir_ways if is_dir else file_ways).get(end_fix)
+
+
+def read_entry(dir_path: str, name: str, way: OutputWay) -> OutputEntry:
+    """读取一项的元数据, 动图只读取文件头; 无法读取 (正在写入或已损坏) 时帧数为 0"""
+    path = join(dir_path, name)
+    entry = OutputEntry(name, way)
+    try:
+        entry.bytes = output_size(path)
+        if way == OutputWay.RAW_RGBA:
+            store = RawFrameStore(path)
+            entry.frame_count, entry.size = store.count, store.size
+            store.close()
+        else:
+            source = open_frame_source(path, way)
+            try:
+                entry.frame_count, entry.size = source.count, source.size
+            finally:
+                source.close()
+    except Exception:
+        pass
+    return entry
+
+
+class OutputDirScanner:
+    """
+    在后台线程中每 interval 秒扫描一次 watch 给出的文件夹, rescan 立即扫描
+    deliver 的参数为 (文件夹, 新出现或改变的项, 已删除的项的名称), 在后台线程中调用,
+    界面需自行转交主线程, 并丢弃已切换走的文件夹的结果
+    """
+
+    def __init__(self, deliver: Callable[[str, list[OutputEntry], list[str]], None],
+                 interval: float = OUTPUT_SCAN_INTERVAL):
+        self.deliver = deliver
+        self.interval = interval
+        self.dir_path: str | None = None
+        self.closed = False
+        self.wake = Event()
+        Thread(target=self.run, daemon=True).start()
+
+    def watch(self, dir_path: str):
+        self.dir_path = dir_path
+        self.wake.set()
+
+    def rescan(self):
+        self.wake.set()
+
+    def close(self):
+        self.closed = True
+        self.wake.set()
+
+    def run(self):
+        cache: dict[str, tuple[tuple[int, int], OutputEntry]] = {}  # 名称 -> ((修改时间, 大小), 元数据)
+        scanned = None
+        while not self.closed:
+            self.wake.clear()
+            dir_path = self.dir_path
+            if dir_path != scanned:
+                cache.clear()
+                scanned = dir_path
+            if dir_path is not None:
+                self.scan(dir_path, cache)
+            self.wake.wait(self.interval)
+
+    def scan(self, dir_path: str, cache: dict[str, tuple[tuple[int, int], OutputEntry]]):
+        try:
+            with os.scandir(dir_path) as it:
+                items = sorted(it, key=lambda item: item.name)
+        except OSError:
+            items = []
+        present = set()
+        batch = []
+        for item in items:
+            if self.closed or self.dir_path != dir_path:
+                return
+            try:
+                way = output_way_of(item.name, item.is_dir())
+                if way is None:
+                    continue
+                stat = item.stat()
+            except OSError:
+                continue
+            present.add(item.name)
+            stamp = (stat.st_mtime_ns, stat.st_size)
+            cached = cache.get(item.name)
+            if cached is not None and cached[0] == stamp:
+                continue
+            entry = read_entry(dir_path, item.name, way)
+            cache[item.name] = (stamp, entry)
+            batch.append(entry)
+            if len(batch) >= OUTPUT_SCAN_BATCH:
+                self.deliver(dir_path, batch, [])
+                batch = []
+        removed = [name for name in cache if name not in present]
+        for name in removed:
+            del cache[name]
+        if batch or removed:
+            self.deliver(dir_path, batch, removed)
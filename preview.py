@@ -0,0 +1,169 @@
+"""
+preview.py
+预览用的逐帧解码, 不导入 wx
+帧按需解码: 后台线程从播放位置开始向后提前解码, 已解码的帧总大小不超过字节预算, 播放位置之外的帧随之淘汰
+"""
+from collections import OrderedDict
+from dataclasses import dataclass
+from os import listdir
+from os.path import join
+from threading import Thread, Condition
+
+from PIL import Image
+
+from output import OutputWay
+
+PREVIEW_DECODE_BUDGET = 64 * 1024 * 1024  # 提前解码的帧最多占用的字节数
+
+
+@dataclass
+class DecodedFrame:
+    size: tuple[int, int]
+    rgb: bytes
+    alpha: bytes | None
+
+
+def decode_frame(image: Image.Image) -> DecodedFrame:
+    """转换为 wx.Image 可直接使用的 RGB 与透明度数据"""
+    if image.mode in ["RGB", "L"]:
+        return DecodedFrame(image.size, image.convert("RGB").tobytes(), None)
+    image = image.convert("RGBA")
+    return DecodedFrame(image.size, image.convert("RGB").tobytes(), image.getchannel("A").tobytes())
+
+
+class FrameSource:
+    """可按下标读取的帧序列, count 为总帧数, size 为每帧尺寸"""
+    count = 0
+    size = (0, 0)
+
+    def read(self, index: int) -> Image.Image:
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class AnimatedFileSource(FrameSource):
+    """GIF / APNG / WebP 动图, 打开时只读取文件头; 顺序读取时 seek 不会从头解码"""
+
+    def __init__(self, path: str):
+        self.image = Image.open(path)
+        self.count = getattr(self.image, "n_frames", 1)
+        self.size = self.image.size
+
+    def read(self, index: int) -> Image.Image:
+        self.image.seek(index)
+        return self.image
+
+    def close(self):
+        self.image.close()
+
+
+class FramesDirSource(FrameSource):
+    """逐帧输出的文件夹, 帧文件名为 名称_序号.后缀, 只列一次目录"""
+
+    def __init__(self, dir_path: str):
+        paths: dict[int, str] = {}
+        for name in listdir(dir_path):
+            index = name[name.rfind("_") + 1:name.rfind(".")]
+            if index.isdigit():
+                paths[int(index)] = join(dir_path, name)
+        # 只取从 0 开始连续的部分
+        self.paths = []
+        while len(self.paths) in paths:
+            self.paths.append(paths[len(self.paths)])
+        self.count = len(self.paths)
+        if self.paths:
+            with Image.open(self.paths[0]) as image:
+                self.size = image.size
+
+    def read(self, index: int) -> Image.Image:
+        with Image.open(self.paths[index]) as image:
+            image.load()
+            return image
+
+
+def open_frame_source(path: str, output_way: OutputWay) -> FrameSource:
+    if output_way in [OutputWay.FRAMES_PNG, OutputWay.FRAMES_JPG]:
+        return FramesDirSource(path)
+    return AnimatedFileSource(path)
+
+
+class PreviewDecoder:
+    """
+    后台线程解码 source 中从播放位置 position 开始的帧, 最多提前 budget 字节, 超出的帧按距播放位置由远到近淘汰
+    get 设置播放位置并返回已解码好的帧 (尚未解码时返回 None)
+    """
+
+    def __init__(self, source: FrameSource, budget: int = PREVIEW_DECODE_BUDGET):
+        self.source = source
+        self.count = source.count
+        width, height = source.size
+        self.ahead = max(1, min(self.count, budget // max(1, width * height * 4)))
+        self.frames: dict[int, DecodedFrame] = {}
+        self.position = 0
+        self.closed = False
+        self.condition = Condition()
+        self.thread = Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def distance(self, index: int) -> int:
+        """index 在播放位置之后第几帧 (循环播放)"""
+        return (index - self.position) % self.count
+
+    def get(self, index: int) -> DecodedFrame | None:
+        with self.condition:
+            if index != self.position:
+                self.position = index
+                self.condition.notify()
+            return self.frames.get(index)
+
+    def next_index(self) -> int | None:
+        """提前解码窗口中第一个尚未解码的帧"""
+        for offset in range(self.ahead):
+            index = (self.position + offset) % self.count
+            if index not in self.frames:
+                return index
+        return None
+
+    def run(self):
+        try:
+            while True:
+                with self.condition:
+                    while not self.closed and (index := self.next_index()) is None:
+                        self.condition.wait()
+                    if self.closed:
+                        return
+                frame = decode_frame(self.source.read(index))
+                with self.condition:
+                    if self.distance(index) < self.ahead:
+                        self.frames[index] = frame
+                    for old_index in [i for i in self.frames if self.distance(i) >= self.ahead]:
+                        del self.frames[old_index]
+        finally:
+            self.source.close()
+
+    def close(self):
+        with self.condition:
+            self.closed = True
+            self.condition.notify()
+
+
+class LRUCache(OrderedDict):
+    """按最近使用淘汰的缓存, 最多保留 limit 项"""
+
+    def __init__(self, limit: int):
+        super().__init__()
+        self.limit = max(1, limit)
+
+    def get(self, key, default=None):
+        if key in self:
+            self.move_to_end(key)
+            return self[key]
+        return default
+
+    def put(self, key, value):
+        self[key] = value
+        self.move_to_end(key)
+        while len(self) > self.limit:
+            self.popitem(last=False)
@@ -0,0 +1,132 @@
+"""
+profiling.py
+渲染流程的性能统计: 分阶段计时与计数、每个文件的帧率与写入字节数、峰值内存
+默认关闭, 关闭时 stage 返回共用的空上下文, 几乎没有开销
+各阶段的时间按线程累计, 生成帧与编码在不同线程中并行, 因此各阶段之和可能大于总耗时
+"""
+import csv
+import json
+import sys
+from contextlib import nullcontext
+from threading import Lock
+from time import perf_counter
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块, 不统计峰值内存
+    resource = None
+
+enabled = False
+started = perf_counter()
+lock = Lock()
+stages: dict[str, list] = {}  # 阶段名 -> [次数, 秒]
+counters: dict[str, int] = {}
+files: list[dict] = []
+NULL_CONTEXT = nullcontext()
+
+
+def enable():
+    """开启统计并清空已有的数据 (fork 出的工作进程会继承主进程的数据)"""
+    global enabled, started
+    enabled = True
+    started = perf_counter()
+    take()
+
+
+class Timer:
+    __slots__ = ("name", "start")
+
+    def __init__(self, name: str):
+        self.name = name
+        self.start = 0.0
+
+    def __enter__(self):
+        self.start = perf_counter()
+
+    def __exit__(self, *_):
+        add_time(self.name, perf_counter() - self.start)
+
+
+def stage(name: str):
+    """用法: with stage("compose"): ..."""
+    return Timer(name) if enabled else NULL_CONTEXT
+
+
+def add_time(name: str, seconds: float, count: int = 1):
+    with lock:
+        entry = stages.setdefault(name, [0, 0.0])
+        entry[0] += count
+        entry[1] += seconds
+
+
+def count(name: str, value: int = 1):
+    if enabled:
+        with lock:
+            counters[name] = counters.get(name, 0) + value
+
+
+def record_file(filename: str, frames: int, seconds: float, nbytes: int):
+    if enabled:
+        with lock:
+            files.append({"file": filename, "frames": frames, "seconds": seconds,
+                          "fps": frames / seconds if seconds else 0.0, "bytes": nbytes})
+
+
+def take() -> dict:
+    """取出并清空本进程的统计, 用于把工作进程的统计交给主进程"""
+    with lock:
+        snapshot = {"stages": dict(stages), "counters": dict(counters), "files": list(files)}
+        stages.clear()
+        counters.clear()
+        files.clear()
+    return snapshot
+
+
+def merge(snapshot: dict):
+    for name, (times, seconds) in snapshot["stages"].items():
+        add_time(name, seconds, times)
+    with lock:
+        for name, value in snapshot["counters"].items():
+            counters[name] = counters.get(name, 0) + value
+        files.extend(snapshot["files"])
+
+
+def peak_rss(who: int | None = None) -> int | None:
+    """峰值常驻内存 (字节); who 默认为本进程, RUSAGE_CHILDREN 为已结束的子进程中的最大值"""
+    if resource is None:
+        return None
+    usage = resource.getrusage(resource.RUSAGE_SELF if who is None else who)
+    return usage.ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def report() -> dict:
+    with lock:
+        return {
+            "wall_seconds": perf_counter() - started,
+            "peak_rss_bytes": peak_rss(),
+            "peak_rss_children_bytes": peak_rss(resource.RUSAGE_CHILDREN) if resource is not None else None,
+            "stages": {name: {"count": times, "seconds": seconds} for name, (times, seconds) in stages.items()},
+            "counters": dict(counters),
+            "files": list(files),
+        }
+
+
+def write_report(path: str):
+    """按后缀写出 JSON 或 CSV 报告"""
+    data = report()
+    if not path.lower().endswith(".csv"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        return
+    with open(path, "w", encoding="utf-8", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(["kind", "name", "count", "seconds", "fps", "bytes"])
+        writer.writerow(["run", "wall", "", data["wall_seconds"], "", ""])
+        writer.writerow(["run", "peak_rss", "", "", "", data["peak_rss_bytes"]])
+        writer.writerow(["run", "peak_rss_children", "", "", "", data["peak_rss_children_bytes"]])
+        for name, entry in data["stages"].items():
+            writer.writerow(["stage", name, entry["count"], entry["seconds"], "", ""])
+        for name, value in data["counters"].items():
+            writer.writerow(["counter", name, value, "", "", ""])
+        for entry in data["files"]:
+            writer.writerow(["file", entry["file"], entry["frames"], entry["seconds"], entry["fps"], entry["bytes"]])
@@ -0,0 +1,46 @@
+"""
+progress.py
+线程安全的进度通道, 不导入 wx
+处理线程 (或汇总各工作进程进度的 batch.render_batch) 随时 post 最新的计数, 只在锁内赋值, 不做任何界面操作;
+界面用定时器以固定频率 poll, 进度未变化时返回 None, 因此汇报进度的开销与帧数无关, 也不会在其他线程中操作界面
+"""
+from dataclasses import dataclass, replace
+from threading import Lock
+
+
+@dataclass
+class Progress:
+    filename: str = ""  # 当前文件
+    phase: str = ""  # 当前阶段, 如 "加载光效"、"生成并保存帧"、"已暂停"
+    files_done: int = 0
+    total_files: int = 0
+    frames_done: int = 0
+    total_frames: int = 0
+    note: str = ""  # 附加在进度下方的说明, 如缓存命中情况
+
+
+class ProgressChannel:
+    def __init__(self):
+        self.lock = Lock()
+        self.state = Progress()
+        self.version = 0  # 每次 post 加一
+        self.polled = 0  # 上次 poll 时的 version
+
+    def post(self, **fields):
+        """更新部分字段, 如 post(frames_done=10)"""
+        with self.lock:
+            for name, value in fields.items():
+                setattr(self.state, name, value)
+            self.version += 1
+
+    def snapshot(self) -> Progress:
+        with self.lock:
+            return replace(self.state)
+
+    def poll(self) -> Progress | None:
+        """自上次 poll 以来有更新时返回当前进度的副本, 否则返回 None"""
+        with self.lock:
+            if self.version == self.polled:
+                return None
+            self.polled = self.version
+            return replace(self.state)
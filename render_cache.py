@@ -0,0 +1,187 @@
+"""
+render_cache.py
+按内容寻址的渲染缓存
+输出文件夹中的清单按输入文件名记录渲染键与输出, 渲染键由输入文件内容的哈希与全部渲染参数决定;
+再次处理时, 渲染键相同且输出完好的文件直接跳过, 内容相同但文件名不同的文件由已有输出硬链接 (不支持时复制) 得到
+"""
+import hashlib
+import json
+import os
+import shutil
+from dataclasses import asdict
+from os.path import basename, dirname, getmtime, isdir, join, relpath, exists
+from time import sleep, time
+
+import profiling
+from glint import GLINT_BLUR_RADIUS, GLINT_BRIGHTNESS, glint_cache_key
+from ingest import open_input
+from output import OutputWays, EncoderSettings, as_ways, new_frames_dir, output_size
+
+MANIFEST_NAME = ".glint_manifest.json"
+MANIFEST_VERSION = 1
+MANIFEST_LOCK_TIMEOUT = 30  # 锁文件存在超过此时间 (秒) 视为其他进程异常退出后遗留的
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def file_hash(path: str) -> str:
+    sha1 = hashlib.sha1()
+    with open_input(path) as f:
+        while chunk := f.read(HASH_CHUNK_SIZE):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def render_params(output_way: OutputWays, frame_count: int, glint_scale: int, input_scale: int,
+                  settings: EncoderSettings | None = None) -> str:
+    """决定输出内容的全部渲染参数, 序列化为字符串以便比较"""
+    return json.dumps({
+        "frame_count": frame_count,
+        "glint": glint_cache_key(glint_scale, GLINT_BLUR_RADIUS, GLINT_BRIGHTNESS),
+        "input_scale": input_scale,
+        "output_way": "+".join(way.name for way in as_ways(output_way)),
+        "settings": asdict(settings or EncoderSettings()),
+    }, sort_keys=True)
+
+
+def link_file(src: str, dst: str):
+    """把 src 硬链接到 dst (不支持时复制), 先写到临时文件再替换, 不会改动 dst 原有的内容"""
+    temp_path = f"{dst}.{os.getpid()}.tmp"
+    try:
+        os.link(src, temp_path)
+    except OSError:
+        shutil.copyfile(src, temp_path)
+    os.replace(temp_path, dst)
+
+
+class ManifestLock:
+    """用独占创建的锁文件在多个进程 (包括同时运行的多个批处理) 之间互斥地读写清单"""
+
+    def __init__(self, manifest_path: str):
+        self.path = manifest_path + ".lock"
+
+    def __enter__(self):
+        while True:
+            try:
+                os.close(os.open(self.path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+                return self
+            except FileExistsError:
+                try:
+                    if time() - getmtime(self.path) > MANIFEST_LOCK_TIMEOUT:
+                        os.remove(self.path)
+                        continue
+                except FileNotFoundError:
+                    continue
+                sleep(0.02)
+
+    def __exit__(self, *_):
+        os.remove(self.path)
+
+
+class RenderCache:
+    """
+    一个输出文件夹与一组渲染参数对应的缓存
+    lookup 判断文件是否需要渲染, record 记录渲染好的输出, save 把新记录合并写入清单
+    hits / misses 为命中与未命中的文件数
+    """
+
+    def __init__(self, output_dir: str, output_way: OutputWays, frame_count: int, glint_scale: int, input_scale: int,
+                 settings: EncoderSettings | None = None):
+        self.output_dir = output_dir
+        self.manifest_path = join(output_dir, MANIFEST_NAME)
+        self.params = render_params(output_way, frame_count, glint_scale, input_scale, settings)
+        self.entries = self.read()
+        self.by_key: dict[str, set[str]] = {}
+        for name, entry in self.entries.items():
+            self.by_key.setdefault(entry["key"], set()).add(name)
+        self.keys: dict[str, str] = {}
+        self.updates: dict[str, dict] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def read(self) -> dict[str, dict]:
+        try:
+            with open(self.manifest_path, encoding="utf-8") as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get("version") != MANIFEST_VERSION:
+            return {}
+        return manifest["entries"]
+
+    def render_key(self, filename: str) -> str:
+        return hashlib.sha1(f"{file_hash(filename)}{self.params}".encode()).hexdigest()
+
+    def intact(self, entry: dict) -> bool:
+        """记录的输出仍然存在且大小未变"""
+        try:
+            return all(output_size(join(self.output_dir, output)) == size
+                       for output, size in zip(entry["outputs"], entry["sizes"]))
+        except OSError:
+            return False
+
+    def lookup(self, filename: str) -> bool:
+        """返回 True 表示 filename 的输出已是最新的 (直接命中或由相同内容的输出链接得到), 无需渲染"""
+        with profiling.stage("cache_lookup"):
+            key = self.keys[filename] = self.render_key(filename)
+            name = basename(filename)
+            entry = self.entries.get(name)
+            if entry is not None and entry["key"] == key and self.intact(entry):
+                self.hits += 1
+                return True
+            for source_name in self.by_key.get(key, ()):
+                source = self.entries[source_name]
+                if source_name != name and source["key"] == key and self.intact(source):
+                    self.record(filename, self.link(source_name, source, name))
+                    self.hits += 1
+                    return True
+            self.misses += 1
+            return False
+
+    def link(self, source_name: str, source: dict, name: str) -> list[str]:
+        """把 source_name 的输出链接为 name 的输出, 文件名中的前缀随之替换, 返回新输出的路径"""
+        source_stem = source_name.split(".")[0]
+        stem = name.split(".")[0]
+        outputs = []
+        dirs = []
+        for output in source["outputs"]:
+            source_path = join(self.output_dir, output)
+            if isdir(source_path):
+                dirs.append(source_path)
+                continue
+            path = join(dirname(source_path), stem + basename(source_path)[len(source_stem):])
+            if path != source_path or not exists(path):
+                link_file(source_path, path)
+            outputs.append(path)
+        # 逐帧输出的文件夹最后创建, 避开同时输出的动图 (如 name 本身即 APNG 的文件名)
+        for source_path in dirs:
+            dir_name = new_frames_dir(name, self.output_dir, outputs)
+            for frame_name in os.listdir(source_path):
+                link_file(join(source_path, frame_name), join(dir_name, stem + frame_name[len(source_stem):]))
+            outputs.append(dir_name)
+        return outputs
+
+    def record(self, filename: str, outputs: list[str]):
+        name = basename(filename)
+        entry = {
+            "key": self.keys[filename],
+            "outputs": [relpath(output, self.output_dir) for output in outputs],
+            "sizes": [output_size(output) for output in outputs],
+        }
+        self.entries[name] = self.updates[name] = entry
+        self.by_key.setdefault(entry["key"], set()).add(name)
+
+    def save(self):
+        """在锁内重新读取清单并合并本次的记录, 不会覆盖同时运行的其他批处理写入的记录"""
+        if not self.updates:
+            return
+        with ManifestLock(self.manifest_path):
+            entries = self.read()
+            entries.update(self.updates)
+            temp_path = f"{self.manifest_path}.{os.getpid()}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump({"version": MANIFEST_VERSION, "entries": entries}, f, ensure_ascii=False, indent=1)
+            os.replace(temp_path, self.manifest_path)
+        self.updates.clear()
+
+    def progress_text(self) -> str:
+        return f"缓存命中: {self.hits}  未命中: {self.misses}"
@@ -0,0 +1,77 @@
+"""
+thumbnail.py
+输入文件列表的缩略图: 后台线程生成, 磁盘缓存按 路径+修改时间 命中, 不导入 wx
+"""
+import hashlib
+import os
+from os.path import join, abspath, isfile
+from queue import Queue, Empty
+from threading import Thread
+from typing import Callable
+
+from PIL import Image
+
+from disk_cache import write_cache, evict_cache
+from ingest import open_input, input_signature
+
+THUMBNAIL_SIZE = 64
+THUMBNAIL_CACHE_DIR = join("cache", "thumbnail")
+THUMBNAIL_CACHE_LIMIT = 64 * 1024 * 1024  # 缩略图缓存的最大字节数 (见 disk_cache.evict_cache)
+THUMBNAIL_BATCH = 32  # 每生成这么多个缩略图 (或暂时没有新任务时) 交付一次
+
+
+def thumbnail_cache_key(path: str) -> str:
+    return hashlib.sha1(f"{abspath(path)}|{input_signature(path)}|{THUMBNAIL_SIZE}".encode()).hexdigest()
+
+
+def make_thumbnail(path: str) -> bytes:
+    """THUMBNAIL_SIZE x THUMBNAIL_SIZE 的 RGBA 像素数据"""
+    with Image.open(open_input(path)) as image:
+        return image.convert("RGBA").resize((THUMBNAIL_SIZE, THUMBNAIL_SIZE), resample=Image.Resampling.BOX).tobytes()
+
+
+def load_thumbnail(path: str, cache_dir: str = THUMBNAIL_CACHE_DIR) -> bytes:
+    """同 make_thumbnail, 但优先读取磁盘缓存, 未命中时生成并写入缓存"""
+    cache_path = join(cache_dir, thumbnail_cache_key(path) + ".rgba")
+    if isfile(cache_path):
+        os.utime(cache_path)
+        with open(cache_path, "rb") as f:
+            return f.read()
+    data = make_thumbnail(path)
+    write_cache(cache_path, lambda f: f.write(data))
+    return data
+
+
+class ThumbnailLoader:
+    """
+    在后台线程中按提交顺序生成缩略图, 结果分批交给 deliver
+    deliver 的参数为 [(item_id, RGBA数据 或 None (无法读取))], 在后台线程中调用, 界面需自行转交主线程
+    """
+
+    def __init__(self, deliver: Callable[[list[tuple[int, bytes | None]]], None]):
+        self.deliver = deliver
+        self.jobs: Queue = Queue()
+        Thread(target=self.run, daemon=True).start()
+
+    def submit(self, item_id: int, path: str):
+        self.jobs.put((item_id, path))
+
+    def run(self):
+        while True:
+            batch = [self.load(*self.jobs.get())]
+            while len(batch) < THUMBNAIL_BATCH:
+                try:
+                    item_id, path = self.jobs.get_nowait()
+                except Empty:
+                    break
+                batch.append(self.load(item_id, path))
+            self.deliver(batch)
+            if self.jobs.empty():
+                evict_cache(THUMBNAIL_CACHE_DIR, ".rgba", THUMBNAIL_CACHE_LIMIT)
+
+    @staticmethod
+    def load(item_id: int, path: str) -> tuple[int, bytes | None]:
+        try:
+            return item_id, load_thumbnail(path)
+        except (OSError, ValueError, KeyError):
+            return item_id, None
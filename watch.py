@@ -0,0 +1,168 @@
+"""
+watch.py
+监视模式: 常驻运行, 输入文件改变后自动重新渲染, 不导入 wx
+光效层只准备一次, 常驻内存; 按 WATCH_INTERVAL 轮询输入的签名 (见 ingest.input_signature,
+压缩包中只有改变的成员会重新渲染), 签名在 debounce 秒内不再变化后才处理 (编辑器保存时常分多次写入);
+改变的文件交给少量渲染线程, 每个文件报告从保存到输出更新的耗时
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor, Future, FIRST_COMPLETED, wait
+from os.path import basename, join, exists, isdir
+from threading import Event
+from time import time, perf_counter, sleep
+from typing import Callable, Iterable
+
+import numpy as np
+
+from compositor import process_an_file, loop_period
+from glint import load_cached_glint
+from ingest import split_archive_path, input_signature
+from output import (OutputWay, OutputWays, EncoderSettings, FrameWriter, FramesDirWriter, FanOutWriter,
+                    ResourcePackWriter, as_ways, open_writer, write_frames, record_outputs, buffered, frames_for_output)
+from render_cache import RenderCache
+
+WATCH_INTERVAL = 0.25  # 轮询输入的间隔 (秒)
+WATCH_DEBOUNCE = 0.5  # 文件签名保持不变这么久 (秒) 后才开始渲染
+WATCH_WORKERS = min(4, os.cpu_count() or 1)  # 渲染线程数 (PIL 编码时释放 GIL)
+
+
+def saved_at(path: str) -> float:
+    """输入文件最后保存的时间, 压缩包成员为压缩包的修改时间"""
+    split = split_archive_path(path)
+    return os.stat(path if split is None else split[0]).st_mtime
+
+
+class Watcher:
+    """
+    监视 inputs() 给出的输入 (每次轮询时重新调用, 如 lambda: ingest.iter_inputs(paths)), 把改变的输入渲染到 output_dir
+    启动时所有输入都视为改变 (只报告渲染耗时), 给出 cache 时输出已是最新的文件直接跳过
+    逐帧输出写入与输入同名的文件夹 (覆盖其中的帧), 不会每次新建文件夹
+    """
+
+    def __init__(self, inputs: Callable[[], Iterable[str]], output_dir: str, output_way: OutputWays, frame_count: int,
+                 glint_scale: int, input_scale: int, settings: EncoderSettings | None = None,
+                 workers: int = WATCH_WORKERS, debounce: float = WATCH_DEBOUNCE, cache: RenderCache | None = None,
+                 report: Callable[[str], None] = print):
+        self.inputs = inputs
+        self.output_dir = output_dir
+        self.output_way = output_way
+        self.frame_count = frame_count
+        self.input_scale = input_scale
+        self.settings = settings
+        self.debounce = debounce
+        self.cache = cache
+        self.report = report
+        self.glint: np.ndarray = load_cached_glint(glint_scale)[1]
+        self.period = loop_period((self.glint.shape[1], self.glint.shape[0]))
+        self.executor = ThreadPoolExecutor(workers)
+        self.rendered: dict[str, str] = {}  # 输入 -> 已渲染 (或正在渲染) 的签名
+        self.pending: dict[str, tuple[str, float]] = {}  # 输入 -> (改变后的签名, 发现的时间)
+        self.running: dict[Future, tuple[str, float | None]] = {}  # -> (输入, 保存时间, 启动时已有的输入为 None)
+
+    def scan(self) -> dict[str, str]:
+        signatures = {}
+        for path in self.inputs():
+            try:
+                signatures[path] = input_signature(path)
+            except (OSError, KeyError):  # 刚被删除或压缩包正在写入
+                pass
+        return signatures
+
+    def frames_dir(self, path: str, reserved: set[str]) -> str:
+        """
+        逐帧输出的文件夹, 每次都是同一个: 与输入同名, 与同时输出的其他文件 (如 APNG 动图) 重名时追加序号
+        """
+        name = basename(path)
+        frames_dir = join(self.output_dir, name)
+        counter = 1
+        while frames_dir in reserved or (exists(frames_dir) and not isdir(frames_dir)):
+            frames_dir = join(self.output_dir, f"{name} ({counter})")
+            counter += 1
+        os.makedirs(frames_dir, exist_ok=True)
+        return frames_dir
+
+    def open_writer(self, path: str) -> FrameWriter:
+        """同 output.open_writer, 但逐帧输出写入固定的文件夹 (覆盖其中的帧), 不会每次新建"""
+        ways = as_ways(self.output_way)
+        frames_ways = [way for way in ways if way in [OutputWay.FRAMES_PNG, OutputWay.FRAMES_JPG]]
+        writers = [open_writer(basename(path), self.output_dir, way, self.settings, self.period)
+                   for way in ways if way not in frames_ways]
+        reserved = {output for writer in writers for output in writer.outputs()}
+        for way in frames_ways:
+            writers.append(FramesDirWriter(path, self.frames_dir(path, reserved), way, settings=self.settings))
+        if len(writers) == 1:
+            return writers[0]
+        return FanOutWriter(writers, max_frames=[None if isinstance(writer, ResourcePackWriter) else self.frame_count
+                                                 for writer in writers])
+
+    def render(self, path: str) -> tuple[list[str], float]:
+        """在渲染线程中运行, 返回 (写出的文件或文件夹, 耗时)"""
+        start = perf_counter()
+        frame_count = frames_for_output(self.output_way, self.frame_count, self.period)
+        frames = buffered(process_an_file(path, self.glint, frame_count, self.input_scale))
+        writer = self.open_writer(path)
+        write_frames(writer, frames, lambda _: None)
+        record_outputs(basename(path), writer, start)
+        return writer.outputs(), perf_counter() - start
+
+    def poll(self):
+        """检查一次输入, 提交签名已稳定的改变; 渲染中的文件等渲染结束后再检查"""
+        now = time()
+        busy = {path for path, _ in self.running.values()}
+        for path, signature in self.scan().items():
+            if signature == self.rendered.get(path):
+                self.pending.pop(path, None)
+                continue
+            seen = self.pending.get(path)
+            if seen is None or seen[0] != signature:
+                self.pending[path] = (signature, now)
+                continue
+            if now - seen[1] < self.debounce or path in busy:
+                continue
+            del self.pending[path]
+            changed = path in self.rendered
+            self.rendered[path] = signature
+            try:
+                if self.cache is not None and self.cache.lookup(path):
+                    continue
+                saved = saved_at(path) if changed else None
+                self.running[self.executor.submit(self.render, path)] = (path, saved)
+            except (OSError, KeyError):
+                pass
+
+    def collect(self, timeout: float):
+        """等待渲染结束 (最多 timeout 秒), 记录输出并报告耗时"""
+        if not self.running:
+            sleep(timeout)
+            return
+        done, _ = wait(self.running, timeout, FIRST_COMPLETED)
+        for future in done:
+            path, saved = self.running.pop(future)
+            if future.cancelled():
+                continue
+            try:
+                outputs, seconds = future.result()
+            except Exception as e:  # 文件可能还没写完, 等它再次改变
+                self.report(f"处理失败: {path}: {e!r}")
+                continue
+            if self.cache is not None:
+                self.cache.record(path, outputs)
+                self.cache.save()
+            if saved is None:
+                self.report(f"已更新: {path}  渲染 {seconds:.2f}s")
+            else:
+                self.report(f"已更新: {path}  保存到输出更新 {time() - saved:.2f}s (渲染 {seconds:.2f}s)")
+
+    def run(self, stop: Event | None = None):
+        """一直运行到 stop 被设置 (或 KeyboardInterrupt), 退出前等待正在进行的渲染"""
+        stop = stop or Event()
+        try:
+            while not stop.is_set():
+                self.poll()
+                self.collect(WATCH_INTERVAL)
+        finally:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            while self.running:
+                self.collect(0)
+            if self.cache is not None:
+                self.cache.save()
@@ -111,18 +111,37 @@ class LabelChoice(wx.Panel):
         return self.text.GetSelection()
 
 
+class LabelCheckList(wx.Panel):
+    """可多选的 LabelChoice"""
+
+    def __init__(self, parent, label, choices=None, size=wx.DefaultSize, style=0, name=wx.StaticTextNameStr):
+        super().__init__(parent, style=style, size=size, name=name)
+        if choices is None:
+            choices = []
+        self.label = CenteredStaticText(self, label=label, size=(-1, 25))
+        self.text = wx.CheckListBox(self, choices=choices)
+        self.sizer = wx.BoxSizer(wx.HORIZONTAL)
+        self.sizer.Add(self.label, 0, wx.ALIGN_TOP)
+        self.sizer.Add(self.text, 1, wx.EXPAND)
+        self.SetSizer(self.sizer)
+
+    def Append(self, choice: str):
+        self.text.Append(choice)
+
+    def GetCheckedItems(self) -> list[int]:
+        return list(self.text.GetCheckedItems())
+
+
 class FormatedText(wx.StaticText):
     def __init__(self, parent: wx.Window):
         super().__init__(parent, label="当前文件: None (0/0)\n处理过程: None (0.00%) (0/0)")
 
-    def format(self, filename: str, file_count: int, total_file: int, gen_or_save: bool, value: int, total: int):
-        if gen_or_save:
-            keyword = "生成帧"
-        else:
-            keyword = "保存文件"
+    def format(self, filename: str, file_count: int, total_file: int, phase: str, value: int, total: int,
+               note: str = ""):
         self.SetLabel(f"当前文件: {filename} ({file_count}/{total_file})\n"
-                      f"处理过程: {keyword} ({100 * (value / total):.2f}%) ({value}/{total})")
+                      f"处理过程: {phase} ({100 * (value / total if total else 0):.2f}%) ({value}/{total})"
+                      + (f"\n{note}" if note else ""))
 
-    def finish(self, filename: str, total_file: int, total: int):
+    def finish(self, filename: str, total_file: int, total: int, note: str = ""):
         self.SetLabel(f"当前文件: {filename} ({total_file}/{total_file})\n"
-                      f"处理过程: 完成 (100%) ({total}/{total})")
\ No newline at end of file
+                      f"处理过程: 完成 (100%) ({total}/{total})" + (f"\n{note}" if note else ""))
\ No newline at end of file